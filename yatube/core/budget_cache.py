@@ -0,0 +1,282 @@
+"""Кеш в памяти процесса с бюджетом в байтах.
+
+LocMemCache ограничивает число записей (MAX_ENTRIES), а не их размер:
+несколько больших фрагментов раздувают память воркера. Здесь значения,
+как и в LocMemCache, хранятся в pickle, и размер записи — длина pickle и
+ключа. Сверх MAX_BYTES вытесняются давно не читанные записи (LRU), но
+только если к новой обращаются не реже, чем к первой из них (TinyLFU:
+частоты оценивает count-min sketch, раз в 10 * SKETCH_WIDTH обращений
+счётчики делятся пополам). Редкий ключ не вытесняет популярные. add()
+принимается всегда: через него берут блокировки и заводят версии тегов.
+
+По префиксу ключа (до первого «:», у фрагментов шаблонов — имя фрагмента)
+считаются попадания, промахи, вытеснения, отказы в приёме, байты и число
+записей. С STATS_PATH каждый процесс раз в STATS_INTERVAL секунд
+сохраняет свою сводку в DiskStore, и manage.py cache_stats суммирует
+сводки всех живых воркеров.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .diskstore import DiskStore
+
+# Примерные накладные расходы Python на запись: кортеж, строки, словарь.
+ENTRY_OVERHEAD = 200
+FIELDS = ('hits', 'misses', 'evictions', 'rejected', 'bytes', 'entries')
+
+_caches = {}
+_states = {}
+_locks = {}
+
+
+def key_prefix(key):
+    """Группа ключа для статистики."""
+    if ':' in key:
+        return key.split(':', 1)[0]
+    # template.cache.<имя фрагмента>.<md5 переменных>
+    return key.rsplit('.', 1)[0]
+
+
+class FrequencySketch:
+    """Count-min sketch: оценка частоты обращений к ключу сверху."""
+
+    def __init__(self, width, depth=4):
+        self.width = width
+        self.rows = [bytearray(width) for _ in range(depth)]
+        self.additions = 0
+        self.sample = 10 * width
+
+    def _cells(self, key):
+        for seed, row in enumerate(self.rows):
+            yield row, hash((seed, key)) % self.width
+
+    def increment(self, key):
+        for row, cell in self._cells(key):
+            if row[cell] < 255:
+                row[cell] += 1
+        self.additions += 1
+        if self.additions >= self.sample:
+            # Старение: прошлые обращения весят вдвое меньше новых.
+            self.rows = [bytearray(count >> 1 for count in row)
+                         for row in self.rows]
+            self.additions //= 2
+
+    def frequency(self, key):
+        return min(row[cell] for row, cell in self._cells(key))
+
+
+class BudgetCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = name
+        self._max_bytes = options.get('MAX_BYTES', 64 * 1024 * 1024)
+        self._stats_interval = options.get('STATS_INTERVAL', 5)
+        stats_path = options.get('STATS_PATH')
+        self._stats_store = stats_path and DiskStore(
+            stats_path, table='cache_stats'
+        )
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._lock = _locks.setdefault(name, threading.Lock())
+        self._state = _states.setdefault(name, {
+            'bytes': 0,
+            'stats': defaultdict(Counter),
+            'sketch': FrequencySketch(options.get('SKETCH_WIDTH', 4096)),
+            'published': 0.0,
+        })
+
+    def _key(self, key, version):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        return made, key_prefix(key)
+
+    def _live(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self._delete(key)
+            return None
+        return entry
+
+    def _delete(self, key):
+        pickled, expires, size, prefix = self._cache.pop(key)
+        self._state['bytes'] -= size
+        stats = self._state['stats'][prefix]
+        stats['bytes'] -= size
+        stats['entries'] -= 1
+
+    def _set(self, key, prefix, pickled, timeout, admit=False):
+        """Кладёт запись, вытесняя LRU; False, если запись не принята.
+
+        С admit=True новый ключ принимается без сравнения частот.
+        """
+        state = self._state
+        size = len(pickled) + len(key) + ENTRY_OVERHEAD
+        stats = state['stats']
+        existed = self._live(key) is not None
+        if existed:
+            self._delete(key)
+        if size > self._max_bytes:
+            stats[prefix]['rejected'] += 1
+            return False
+        # Жертв набираем с начала LRU, а вытесняем, только приняв ключ:
+        # отказ не должен стоить кешу уже вытесненных записей.
+        victims = []
+        contender = None
+        needed = state['bytes'] + size - self._max_bytes
+        now = time.time()
+        for victim, victim_entry in self._cache.items():
+            if needed <= 0:
+                break
+            expired = victim_entry[1] is not None and victim_entry[1] <= now
+            if contender is None and not expired:
+                contender = victim
+            victims.append((victim, expired))
+            needed -= victim_entry[2]
+        # Обновление ключа принимаем всегда, новый ключ — если к нему
+        # обращаются не реже, чем к первой живой жертве.
+        if (contender is not None and not existed and not admit
+                and state['sketch'].frequency(key)
+                < state['sketch'].frequency(contender)):
+            stats[prefix]['rejected'] += 1
+            return False
+        for victim, expired in victims:
+            if not expired:
+                stats[self._cache[victim][3]]['evictions'] += 1
+            self._delete(victim)
+        self._cache[key] = (
+            pickled, self.get_backend_timeout(timeout), size, prefix
+        )
+        state['bytes'] += size
+        stats[prefix]['bytes'] += size
+        stats[prefix]['entries'] += 1
+        return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key, prefix = self._key(key, version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._state['sketch'].increment(key)
+            if self._live(key) is not None:
+                return False
+            # add() служит блокировкой и заводит версии тегов: отказ в
+            # приёме вызывающий принял бы за чужую блокировку.
+            return self._set(key, prefix, pickled, timeout, admit=True)
+
+    def get(self, key, default=None, version=None):
+        key, prefix = self._key(key, version)
+        with self._lock:
+            self._state['sketch'].increment(key)
+            entry = self._live(key)
+            if entry is None:
+                self._state['stats'][prefix]['misses'] += 1
+            else:
+                self._state['stats'][prefix]['hits'] += 1
+                self._cache.move_to_end(key)
+        self._publish()
+        return default if entry is None else pickle.loads(entry[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key, prefix = self._key(key, version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._state['sketch'].increment(key)
+            self._set(key, prefix, pickled, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)[0]
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self._cache[key] = (
+                entry[0], self.get_backend_timeout(timeout), *entry[2:]
+            )
+            return True
+
+    def incr(self, key, delta=1, version=None):
+        key, prefix = self._key(key, version)
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(entry[0]) + delta
+            pickled = pickle.dumps(value, self.pickle_protocol)
+            # Число почти не меняет размер: пишем на место, без вытеснения.
+            size = len(pickled) + len(key) + ENTRY_OVERHEAD
+            self._state['bytes'] += size - entry[2]
+            self._state['stats'][prefix]['bytes'] += size - entry[2]
+            self._cache[key] = (pickled, entry[1], size, prefix)
+            self._cache.move_to_end(key)
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)[0]
+        with self._lock:
+            return self._live(key) is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)[0]
+        with self._lock:
+            if key in self._cache:
+                self._delete(key)
+
+    def clear(self):
+        # Попадания, промахи и вытеснения накоплены за жизнь процесса и
+        # после очистки остаются; обнуляется только занятое место.
+        with self._lock:
+            self._cache.clear()
+            self._state['bytes'] = 0
+            for stats in self._state['stats'].values():
+                stats['bytes'] = 0
+                stats['entries'] = 0
+
+    def _snapshot(self):
+        with self._lock:
+            return {prefix: dict(counter)
+                    for prefix, counter in self._state['stats'].items()}
+
+    def _publish(self, force=False):
+        state = self._state
+        now = time.monotonic()
+        if not self._stats_store or (
+            not force and now - state['published'] < self._stats_interval
+        ):
+            return
+        state['published'] = now
+        self._stats_store.set(f'{self._name}:{os.getpid()}', json.dumps({
+            'time': time.time(), 'rows': self._snapshot(),
+        }))
+
+    def stats(self):
+        """Счётчики по префиксам ключей, по всем живым процессам."""
+        if not self._stats_store:
+            snapshots = [self._snapshot()]
+        else:
+            self._publish(force=True)
+            keys = self._stats_store.keys(f'{self._name}:')
+            snapshots = []
+            dead = []
+            for key, raw in self._stats_store.get_many(keys).items():
+                snapshot = json.loads(raw)
+                if time.time() - snapshot['time'] > 10 * self._stats_interval:
+                    dead.append(key)
+                else:
+                    snapshots.append(snapshot['rows'])
+            if dead:
+                self._stats_store.delete(*dead)
+        rows = defaultdict(Counter)
+        for snapshot in snapshots:
+            for prefix, counter in snapshot.items():
+                rows[prefix].update(counter)
+        return {prefix: {field: rows[prefix][field] for field in FIELDS}
+                for prefix in sorted(rows)}
@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+
+TAG_PREFIX = 'cache_tag:'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def get_versions(*tags):
+    """Возвращает текущие версии тегов, заводя отсутствующие в кеше."""
+    keys = [TAG_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        attempted = {key: _new_version() for key in missing}
+        for key, version in attempted.items():
+            cache.add(key, version, None)
+        stored = cache.get_many(missing)
+        # Если кеш не удержал версию, отдаём ту, что пытались положить:
+        # зависимые записи просто не найдутся.
+        versions.update(
+            (key, stored.get(key, version))
+            for key, version in attempted.items()
+        )
+    return [versions[key] for key in keys]
+
+
+def tags_version(*tags):
+    """Строка версий для ключа кеша, меняется при инвалидации тегов."""
+    return '.'.join(str(version) for version in get_versions(*tags))
+
+
+def invalidate(*tags):
+    """Сдвигает версии тегов, чтобы зависимые записи кеша устарели."""
+    for tag in set(tags):
+        key = TAG_PREFIX + tag
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
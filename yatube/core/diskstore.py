@@ -0,0 +1,105 @@
+"""Хранилище ключ-значение в файле SQLite, общем для всех процессов.
+
+Таблица без rowid хранит строки прямо в B-дереве первичного ключа, WAL
+даёт читать параллельно с записью, а mmap — читать страницы без вызовов
+read(). Точечный поиск стоит микросекунды и переживает перезапуск.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Ограничение SQLite на число параметров в одном запросе.
+MAX_PARAMS = 900
+
+
+class DiskStore:
+    """Строковые ключи и значения в таблице SQLite."""
+
+    schema = '(key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID'
+
+    def __init__(self, path, table='kv', mmap_size=64 * 1024 * 1024):
+        self.path = path
+        self.table = table
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        local = self._local
+        # Соединение не переживает fork: в дочернем процессе открываем своё.
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        connection = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} {self.schema}'
+        )
+        return connection
+
+    @contextmanager
+    def _write(self):
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def get(self, key):
+        row = self.connection.execute(
+            f'SELECT value FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        return row and row[0]
+
+    def get_many(self, keys):
+        """Словарь найденных значений; отсутствующих ключей в нём нет."""
+        keys = list(keys)
+        found = {}
+        for start in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[start:start + MAX_PARAMS]
+            marks = ', '.join('?' * len(chunk))
+            found.update(self.connection.execute(
+                f'SELECT key, value FROM {self.table} '
+                f'WHERE key IN ({marks})', chunk
+            ))
+        return found
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, mapping):
+        with self._write() as connection:
+            connection.executemany(
+                f'INSERT OR REPLACE INTO {self.table} (key, value) '
+                'VALUES (?, ?)', mapping.items()
+            )
+
+    def delete(self, *keys):
+        with self._write() as connection:
+            connection.executemany(
+                f'DELETE FROM {self.table} WHERE key = ?',
+                ((key,) for key in keys)
+            )
+
+    def keys(self, prefix=''):
+        # Диапазон по индексу вместо LIKE: префикс не сканирует таблицу.
+        return [key for key, in self.connection.execute(
+            f'SELECT key FROM {self.table} WHERE key >= ? AND key < ?',
+            (prefix, prefix + '\U0010ffff')
+        )]
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute(f'DELETE FROM {self.table}')
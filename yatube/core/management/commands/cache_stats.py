@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+FIELD_NAMES = {
+    'evictions': 'вытеснено',
+    'rejected': 'не принято',
+    'bytes': 'байт',
+    'entries': 'записей',
+}
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и объём кешей со статистикой.'
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            backend = caches[alias]
+            if not hasattr(backend, 'stats'):
+                continue
+            for name, row in backend.stats().items():
+                total = row['hits'] + row['misses']
+                ratio = row['hits'] / total if total else 0
+                extra = ''.join(
+                    f', {FIELD_NAMES.get(field, field)} {value}'
+                    for field, value in row.items()
+                    if field not in ('hits', 'misses')
+                )
+                self.stdout.write(
+                    f'{alias} {name}: попаданий {row["hits"]}, '
+                    f'промахов {row["misses"]}, доля {ratio:.1%}{extra}'
+                )
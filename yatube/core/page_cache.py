@@ -0,0 +1,141 @@
+"""Кеш целых страниц для анонимных посетителей.
+
+Страницы из PAGE_CACHE_VIEWS без cookie сессии и сообщений отдаются из
+кеша до сессий, CSRF и ORM. Ключ — путь и номер страницы (?page=), тело
+хранится сжатым gzip. Вместе со страницей сохраняются теги кеша
+(core.cache_tags), собранные ETag-функцией вида. Запись свежая, пока
+версии тегов не сдвинулись и не прошло PAGE_CACHE_TIMEOUT секунд. После
+этого её ещё PAGE_CACHE_STALE_TIMEOUT секунд отдают как есть, а новую
+версию строит в фоне один запрос: остальные не ждут и не бьют в базу.
+Если новая версия не кешируется (например, пост удалён и вид отдал 404),
+устаревшая запись удаляется. Сохранённый ETag проверяется по
+If-None-Match, и клиент с актуальной копией получает 304.
+"""
+import gzip
+import hashlib
+import logging
+import threading
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import (
+    get_conditional_response, patch_vary_headers,
+)
+
+from .cache_tags import tags_version
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'page_cache:'
+# Cookie, при которых страница может отличаться от анонимной.
+PRIVATE_COOKIES = (settings.SESSION_COOKIE_NAME, 'messages')
+
+
+def cache_key(request):
+    """Ключ страницы или None, если запрос кешировать нельзя."""
+    if request.method != 'GET':
+        return None
+    if any(name in request.COOKIES for name in PRIVATE_COOKIES):
+        return None
+    if set(request.GET) - {'page'}:
+        return None
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if match.view_name not in settings.PAGE_CACHE_VIEWS:
+        return None
+    raw = f'{request.path}?page={request.GET.get("page", "")}'
+    return KEY_PREFIX + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _spawn(job):
+    threading.Thread(target=job, daemon=True).start()
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        if not settings.PAGE_CACHE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = cache_key(request)
+        if key is None:
+            return self.get_response(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = self.render(request, key)
+            response['X-Page-Cache'] = 'MISS'
+            return response
+        fresh = self.is_fresh(entry)
+        if not fresh and cache.add(
+            key + ':lock', 1, settings.PAGE_CACHE_LOCK_TIMEOUT
+        ):
+            _spawn(lambda: self.refresh(request.environ, key))
+        return self.cached_response(
+            request, entry, 'HIT' if fresh else 'STALE'
+        )
+
+    @staticmethod
+    def is_fresh(entry):
+        tags, version = entry['tags']
+        return (time.time() - entry['created'] < settings.PAGE_CACHE_TIMEOUT
+                and tags_version(*tags) == version)
+
+    def render(self, request, key, stale=False):
+        response = self.get_response(request)
+        tags = getattr(request, 'cache_tags', None)
+        if (tags is None or response.status_code != 200
+                or response.streaming or response.cookies):
+            if stale:
+                # Прежнюю версию страницы больше отдавать нельзя.
+                cache.delete(key)
+            return response
+        cache.set(key, {
+            'created': time.time(),
+            'tags': tags,
+            'headers': list(response.items()),
+            'body': gzip.compress(response.content),
+        }, settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT)
+        return response
+
+    def refresh(self, environ, key):
+        # Свой запрос с копией окружения: исходный уже отдан клиенту.
+        request = WSGIRequest(dict(environ, **{'wsgi.input': BytesIO()}))
+        try:
+            self.render(request, key, stale=True)
+        except Exception:
+            # Блокировка остаётся до PAGE_CACHE_LOCK_TIMEOUT: иначе каждый
+            # следующий запрос запускал бы новую попытку.
+            logger.exception('Не удалось обновить страницу %s', request.path)
+        else:
+            cache.delete(key + ':lock')
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def cached_response(request, entry, state):
+        accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        body = entry['body'] if accepts_gzip else (
+            gzip.decompress(entry['body'])
+        )
+        response = HttpResponse(body)
+        for header, value in entry['headers']:
+            response[header] = value
+        if accepts_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = str(len(body))
+        patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+        response = get_conditional_response(
+            request, etag=response.get('ETag'), response=response
+        )
+        response['X-Page-Cache'] = state
+        return response
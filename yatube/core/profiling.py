@@ -0,0 +1,85 @@
+"""Профилирование рендера шаблонов.
+
+При TEMPLATE_PROFILING = True middleware замеряет каждый Template._render
+за запрос: шаблоны страниц, include и inclusion-теги. Для каждого шаблона
+считаются вызовы, полное и собственное (без вложенных шаблонов) время и
+число узлов. Сводка уходит в заголовок Server-Timing (видна во вкладке
+Network браузера) и в лог core.profiling.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.base import Node, Template
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_render = Template._render
+
+
+def _node_count(template):
+    count = getattr(template, '_profile_nodes', None)
+    if count is None:
+        count = len(template.nodelist.get_nodes_by_type(Node))
+        template._profile_nodes = count
+    return count
+
+
+def _profiled_render(self, context):
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return _render(self, context)
+    stack = _local.stack
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _render(self, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        entry = profile.setdefault(
+            self.name or '<string>', [0, 0.0, 0.0, _node_count(self)]
+        )
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - nested
+
+
+def server_timing(profile):
+    """Заголовок Server-Timing: по метрике на шаблон, дороже — раньше."""
+    rows = sorted(profile.items(), key=lambda item: -item[1][1])
+    return ', '.join(
+        f'tpl{index};desc="{name} x{calls} self={own * 1000:.2f}ms '
+        f'nodes={nodes}";dur={total * 1000:.2f}'
+        for index, (name, (calls, total, own, nodes)) in enumerate(rows)
+    )
+
+
+class TemplateProfilerMiddleware:
+    def __init__(self, get_response):
+        if not settings.TEMPLATE_PROFILING:
+            raise MiddlewareNotUsed
+        Template._render = _profiled_render
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.profile, _local.stack = {}, []
+        try:
+            response = self.get_response(request)
+        finally:
+            profile = _local.profile
+            _local.profile = None
+        if profile:
+            response['Server-Timing'] = server_timing(profile)
+            for name, (calls, total, own, nodes) in profile.items():
+                logger.debug(
+                    '%s %s: %d calls, %.2f ms, self %.2f ms, %d nodes',
+                    request.path, name, calls, total * 1000, own * 1000,
+                    nodes,
+                )
+        return response
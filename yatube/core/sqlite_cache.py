@@ -0,0 +1,243 @@
+"""Бэкенд кеша Django в файле SQLite, общий для всех воркеров хоста.
+
+LocMemCache у каждого процесса свой: прогрев и сброс тегов в одном
+воркере не видны остальным. Здесь записи лежат в таблице DiskStore (WAL,
+mmap, без rowid), поэтому читатели не ждут писателя, а чтение —
+точечный поиск по B-дереву в отображённой памяти. Значения хранятся
+в pickle, срок годности — в отдельном столбце с индексом. Просроченные
+записи не отдаются и удаляются при чистке раз в CULL_EVERY записей. Число
+записей ведут триггеры в отдельной таблице, так что чистка не считает
+таблицу через COUNT(*).
+
+    CACHES = {'default': {
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': '/path/to/cache.sqlite3',
+    }}
+"""
+import pickle
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .diskstore import MAX_PARAMS, DiskStore
+
+# Через сколько записей процесса проверять размер таблицы.
+CULL_EVERY = 100
+
+
+class CacheStore(DiskStore):
+    """Значения в pickle со сроком годности expires (None — бессрочно)."""
+
+    schema = ('(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) '
+              'WITHOUT ROWID')
+    live = '(expires IS NULL OR expires > ?)'
+
+    def _connect(self):
+        connection = super()._connect()
+        table = self.table
+        # Счётчик заводится один раз, по уже лежащим записям; дальше его
+        # меняют триггеры вставки и удаления в той же транзакции.
+        connection.executescript(f'''
+            BEGIN IMMEDIATE;
+            CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires);
+            CREATE TABLE IF NOT EXISTS {table}_size (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                entries INTEGER NOT NULL
+            );
+            INSERT INTO {table}_size (id, entries)
+                SELECT 1, (SELECT COUNT(*) FROM {table})
+                WHERE NOT EXISTS (SELECT 1 FROM {table}_size);
+            CREATE TRIGGER IF NOT EXISTS {table}_added
+                AFTER INSERT ON {table}
+                BEGIN UPDATE {table}_size SET entries = entries + 1; END;
+            CREATE TRIGGER IF NOT EXISTS {table}_removed
+                AFTER DELETE ON {table}
+                BEGIN UPDATE {table}_size SET entries = entries - 1; END;
+            COMMIT;
+        ''')
+        return connection
+
+    def count(self):
+        """Число записей, включая ещё не удалённые просроченные."""
+        return self.connection.execute(
+            f'SELECT entries FROM {self.table}_size'
+        ).fetchone()[0]
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[start:start + MAX_PARAMS]
+            marks = ', '.join('?' * len(chunk))
+            found.update(
+                (key, pickle.loads(value))
+                for key, value in self.connection.execute(
+                    f'SELECT key, value FROM {self.table} '
+                    f'WHERE key IN ({marks}) AND {self.live}', (*chunk, now)
+                )
+            )
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def has_key(self, key):
+        return self.connection.execute(
+            f'SELECT 1 FROM {self.table} WHERE key = ? AND {self.live}',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def set_many(self, mapping, expires=None):
+        # UPSERT, а не REPLACE: замена через удаление не вызывает триггер
+        # удаления, и счётчик записей бы уплывал.
+        with self._write() as connection:
+            connection.executemany(
+                f'INSERT INTO {self.table} (key, value, expires) '
+                'VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires',
+                ((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+                 for key, value in mapping.items())
+            )
+
+    def set(self, key, value, expires=None):
+        self.set_many({key: value}, expires)
+
+    def add(self, key, value, expires=None):
+        """Записывает значение, только если живого ключа нет."""
+        with self._write() as connection:
+            connection.execute(
+                f'DELETE FROM {self.table} WHERE key = ? AND NOT {self.live}',
+                (key, time.time())
+            )
+            return connection.execute(
+                f'INSERT OR IGNORE INTO {self.table} (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+            ).rowcount == 1
+
+    def incr(self, key, delta):
+        """Новое значение или KeyError, если ключа нет."""
+        with self._write() as connection:
+            row = connection.execute(
+                f'SELECT value FROM {self.table} '
+                f'WHERE key = ? AND {self.live}', (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                f'UPDATE {self.table} SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key)
+            )
+        return value
+
+    def touch(self, key, expires=None):
+        with self._write() as connection:
+            return connection.execute(
+                f'UPDATE {self.table} SET expires = ? '
+                f'WHERE key = ? AND {self.live}', (expires, key, time.time())
+            ).rowcount == 1
+
+    def cull(self, max_entries, cull_frequency):
+        """Удаляет просроченное, а сверх max_entries — 1/cull_frequency
+        записей, которые истекут раньше всех (бессрочные — последними)."""
+        with self._write() as connection:
+            connection.execute(
+                f'DELETE FROM {self.table} WHERE expires <= ?', (time.time(),)
+            )
+            count, = connection.execute(
+                f'SELECT entries FROM {self.table}_size'
+            ).fetchone()
+            if count <= max_entries:
+                return
+            excess = count // cull_frequency or 1
+            excess -= connection.execute(
+                f'DELETE FROM {self.table} WHERE key IN ('
+                f'SELECT key FROM {self.table} WHERE expires IS NOT NULL '
+                'ORDER BY expires LIMIT ?)', (excess,)
+            ).rowcount
+            if excess > 0:
+                connection.execute(
+                    f'DELETE FROM {self.table} WHERE key IN ('
+                    f'SELECT key FROM {self.table} WHERE expires IS NULL '
+                    'LIMIT ?)', (excess,)
+                )
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._store = CacheStore(
+            location, table=options.get('TABLE', 'cache'),
+            mmap_size=options.get('MMAP_SIZE', 256 * 1024 * 1024),
+        )
+        self._writes = 0
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _wrote(self, count=1):
+        self._writes += count
+        if self._writes >= CULL_EVERY:
+            self._writes = 0
+            self._store.cull(self._max_entries, self._cull_frequency)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._store.add(
+            self._key(key, version), value, self.get_backend_timeout(timeout)
+        )
+        self._wrote()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._store.get_many([key])
+        return found[key] if key in found else default
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        return {
+            keys[stored]: value
+            for stored, value in self._store.get_many(keys).items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store.set(
+            self._key(key, version), value, self.get_backend_timeout(timeout)
+        )
+        self._wrote()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store.set_many(
+            {self._key(key, version): value for key, value in data.items()},
+            self.get_backend_timeout(timeout),
+        )
+        self._wrote(len(data))
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store.touch(
+            self._key(key, version), self.get_backend_timeout(timeout)
+        )
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            return self._store.incr(self._key(key, version), delta)
+        except KeyError:
+            raise ValueError(f"Key '{key}' not found") from None
+
+    def has_key(self, key, version=None):
+        return self._store.has_key(self._key(key, version))
+
+    def delete(self, key, version=None):
+        self._store.delete(self._key(key, version))
+
+    def delete_many(self, keys, version=None):
+        self._store.delete(*(self._key(key, version) for key in keys))
+
+    def clear(self):
+        self._store.clear()
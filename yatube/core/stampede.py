@@ -0,0 +1,59 @@
+"""Кеш без давки при истечении записей.
+
+get_or_compute хранит рядом со значением время его вычисления и срок
+годности. Запись пересчитывается заранее с вероятностью, растущей к концу
+срока (XFetch): чем дороже вычисление, тем раньше. Пересчитывает один
+воркер — тот, кто взял блокировку через cache.add; остальные до конца
+пересчёта отдают прежнее значение. Физически запись живёт на
+STAMPEDE_GRACE секунд дольше срока, чтобы прежнее значение было у всех.
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _expired(entry, beta):
+    value, delta, expiry = entry
+    # log(1 - random()) <= 0: к сроку прибавляется случайный запас.
+    return time.time() - delta * beta * math.log(1 - random.random()) >= (
+        expiry
+    )
+
+
+def _wait(key):
+    """Ждёт, пока значение положит воркер с блокировкой."""
+    deadline = time.monotonic() + settings.STAMPEDE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.STAMPEDE_WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_compute(key, compute, timeout, beta=None):
+    """Значение по ключу; compute() вызывается одним воркером за раз."""
+    beta = settings.STAMPEDE_BETA if beta is None else beta
+    entry = cache.get(key)
+    if entry is not None and not _expired(entry, beta):
+        return entry[0]
+    lock = key + ':lock'
+    if not cache.add(lock, 1, settings.STAMPEDE_LOCK_TIMEOUT):
+        if entry is None:
+            entry = _wait(key)
+        if entry is not None:
+            return entry[0]
+        # Воркер с блокировкой не успел: считаем сами, как без кеша.
+        return compute()
+    try:
+        start = time.time()
+        value = compute()
+        finished = time.time()
+        cache.set(key, (value, finished - start, finished + timeout),
+                  timeout + settings.STAMPEDE_GRACE)
+    finally:
+        cache.delete(lock)
+    return value
@@ -0,0 +1,37 @@
+"""Прогрев кеширующего загрузчика шаблонов.
+
+Без DEBUG Django сам оборачивает загрузчики в cached.Loader: каждый файл
+разбирается один раз на процесс. warm_up() разбирает все шаблоны при
+старте воркера, чтобы первые запросы не платили за парсинг.
+"""
+import os
+
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+
+def _template_dirs(engine):
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            yield from inner.get_dirs()
+
+
+def warm_up():
+    """Загружает все шаблоны в кеш загрузчика, возвращает их число."""
+    loaded = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for directory in _template_dirs(backend.engine):
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    name = os.path.relpath(
+                        os.path.join(root, filename), directory
+                    ).replace(os.sep, '/')
+                    try:
+                        backend.engine.get_template(name)
+                    except (TemplateSyntaxError, UnicodeDecodeError):
+                        # Не шаблон Django (например, скрипт из static).
+                        continue
+                    loaded += 1
+    return loaded
@@ -0,0 +1,52 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core import cache_tags
+from core.stampede import get_or_compute
+
+register = template.Library()
+
+
+@register.simple_tag
+def cache_version(**tags):
+    """{% cache_version group=group.slug as version %} -> 'group:<slug>'."""
+    return cache_tags.tags_version(
+        *(f'{kind}:{value}' for kind, value in tags.items())
+    )
+
+
+class CachedNode(template.Node):
+    def __init__(self, nodelist, timeout, name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = int(self.timeout.resolve(context))
+        key = make_template_fragment_key(
+            self.name, [var.resolve(context) for var in self.vary_on]
+        )
+        return get_or_compute(
+            key, lambda: self.nodelist.render(context), timeout
+        )
+
+
+@register.tag
+def cached(parser, token):
+    """{% cached 300 name var ... %} — как {% cache %}, но без давки.
+
+    Истекающий фрагмент пересчитывает один запрос, остальные отдают
+    прежний (core.stampede).
+    """
+    nodelist = parser.parse(('endcached',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 2 arguments."
+        )
+    return CachedNode(
+        nodelist, parser.compile_filter(bits[1]), bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
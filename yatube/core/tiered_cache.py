@@ -0,0 +1,224 @@
+"""Двухуровневый кеш: маленький LRU в памяти процесса перед общим кешем.
+
+L1 — кеш процесса из OPTIONS['L1'] (BudgetCache с бюджетом в байтах),
+L2 — общий кеш из OPTIONS['L2'], например SQLiteCache. Чтение сначала идёт
+в L1, промах — в L2 с записью в L1. Запись идёт в оба уровня.
+
+Согласованность. delete, incr и touch сдвигают в L2 счётчик поколений и
+кладут рядом список затронутых ключей. Каждый процесс раз в SYNC_INTERVAL
+секунд сверяет поколение и выбрасывает из L1 эти ключи, а если отстал
+больше чем на LOG_DEPTH поколений или L2 очищен — весь L1. Так сброс
+тегов (core.cache_tags сдвигает их через incr) доходит до всех L1 не
+позже чем через SYNC_INTERVAL. Перезапись set без сдвига поколения видна
+другим процессам не позже чем через L1_TIMEOUT: дольше запись в L1 не
+живёт.
+
+Блокировки (ключи с суффиксом LOCK_SUFFIX, их берут core.stampede и
+core.page_cache через add) идут прямо в L2: в L1 их не кладут, и их
+удаление не рассылается — другим процессам нечего выбрасывать.
+
+Попадания и промахи обоих уровней копятся в процессе и при сверке
+добавляются к общим счётчикам в L2; их показывает manage.py cache_stats.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+GENERATION_KEY = 'tiered:generation'
+LOG_PREFIX = 'tiered:log:'
+STATS_PREFIX = 'tiered:stats:'
+STATS = ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses')
+LOG_DEPTH = 100
+LOCK_SUFFIX = ':lock'
+
+_MISSING = object()
+_lock = threading.Lock()
+# Состояние сверки по имени кеша: общее для потоков процесса.
+_states = {}
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l1_alias = options.get('L1', 'local')
+        self._l2_alias = options.get('L2', 'shared')
+        self._l1_timeout = options.get('L1_TIMEOUT', 5)
+        self._sync_interval = options.get('SYNC_INTERVAL', 1)
+        name = location or self._l2_alias
+        self._state = _states.setdefault(name, {
+            'generation': None, 'synced': 0.0, 'stats': Counter(),
+        })
+
+    @property
+    def l1(self):
+        return caches[self._l1_alias]
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, name, value=1):
+        with _lock:
+            self._state['stats'][name] += value
+
+    def _remember(self, key, version, value, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            timeout = self._l1_timeout
+        elif timeout <= 0:
+            return
+        self.l1.set(key, value, min(timeout, self._l1_timeout),
+                    version=version)
+
+    def _recall(self, key, version):
+        return self.l1.get(key, _MISSING, version=version)
+
+    def _forget(self, keys):
+        """Убирает из L1 пары (ключ, версия); None — весь L1."""
+        if keys is None:
+            self.l1.clear()
+            return
+        for key, version in keys:
+            self.l1.delete(key, version=version)
+
+    def _invalidate(self, keys):
+        """Убирает пары (ключ, версия) из своего L1 и сообщает остальным."""
+        self._forget(keys)
+        l2 = self.l2
+        # Новый отсчёт (после очистки или вытеснения ключа) начинается со
+        # времени: у остальных получится скачок, и они сбросят L1 целиком.
+        l2.add(GENERATION_KEY, time.time_ns(), None)
+        generation = l2.incr(GENERATION_KEY)
+        l2.set(f'{LOG_PREFIX}{generation}', keys,
+               max(60, LOG_DEPTH * self._sync_interval))
+
+    def _sync(self):
+        state = self._state
+        now = time.monotonic()
+        if now - state['synced'] < self._sync_interval:
+            return
+        state['synced'] = now
+        l2 = self.l2
+        generation = l2.get(GENERATION_KEY, 0)
+        seen = state['generation']
+        if seen != generation:
+            if seen is None or not 0 < generation - seen <= LOG_DEPTH:
+                self._forget(None)
+            else:
+                logs = l2.get_many([
+                    f'{LOG_PREFIX}{number}'
+                    for number in range(seen + 1, generation + 1)
+                ])
+                if (len(logs) < generation - seen
+                        or any(keys is None for keys in logs.values())):
+                    self._forget(None)
+                else:
+                    self._forget(
+                        key for keys in logs.values() for key in keys
+                    )
+            state['generation'] = generation
+        with _lock:
+            stats, state['stats'] = state['stats'], Counter()
+        for name, value in stats.items():
+            l2.add(STATS_PREFIX + name, 0, None)
+            l2.incr(STATS_PREFIX + name, value)
+
+    def stats(self):
+        """Попадания и промахи по уровням, суммарно по всем процессам."""
+        self._state['synced'] = 0.0
+        self._sync()
+        totals = self.l2.get_many(STATS_PREFIX + name for name in STATS)
+        rows = {}
+        for tier in ('l1', 'l2'):
+            hits = totals.get(f'{STATS_PREFIX}{tier}_hits', 0)
+            misses = totals.get(f'{STATS_PREFIX}{tier}_misses', 0)
+            rows[tier] = {'hits': hits, 'misses': misses}
+        return rows
+
+    def get(self, key, default=None, version=None):
+        if key.endswith(LOCK_SUFFIX):
+            return self.l2.get(key, default, version=version)
+        self._sync()
+        value = self._recall(key, version)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        self._count('l1_misses')
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self._remember(key, version, value, DEFAULT_TIMEOUT)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._recall(key, version)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self._count('l1_hits', len(found))
+        if missing:
+            self._count('l1_misses', len(missing))
+            fetched = self.l2.get_many(missing, version=version)
+            self._count('l2_hits', len(fetched))
+            self._count('l2_misses', len(missing) - len(fetched))
+            for key, value in fetched.items():
+                self._remember(key, version, value, DEFAULT_TIMEOUT)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._remember(key, version, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, version, value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if key.endswith(LOCK_SUFFIX):
+            return self.l2.add(key, value, timeout, version=version)
+        # Поколение не сдвигаем: ключа в L2 не было, а его удаление уже
+        # разослано; истёкшая в L2 копия уходит из L1 по L1_TIMEOUT.
+        added = self.l2.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, version, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version=version)
+        self._invalidate([(key, version)])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self._invalidate([(key, version)])
+        return value
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        if not key.endswith(LOCK_SUFFIX):
+            self._invalidate([(key, version)])
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self._invalidate([(key, version) for key in keys])
+
+    def clear(self):
+        self.l2.clear()
+        self._forget(None)
+        with _lock:
+            self._state['stats'].clear()
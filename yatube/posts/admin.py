@@ -1,6 +1,121 @@
-from django.contrib import admin
+from datetime import datetime
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.cache_tags import invalidate, tags_version
+
+from . import counters, exports, search
 # Из модуля models импортируем модель Post
-from .models import Group, Post
+from .models import Group, Post, PostQuerySet
+from .utils import EstimatedPaginator
+
+
+def group_labels():
+    """Названия всех групп по pk; сбрасываются вместе с тегом groups."""
+    key = 'admin_group_labels:' + tags_version('groups')
+    labels = cache.get(key)
+    if labels is None:
+        labels = dict(Group.objects.values_list('pk', 'title'))
+        cache.set(key, labels)
+    return labels
+
+
+class GroupSelect(AutocompleteSelect):
+    """Автодополнение группы без запроса за подписью на каждую строку."""
+
+    def optgroups(self, name, value, attr=None):
+        labels = group_labels()
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        for pk in value:
+            if pk and int(pk) in labels:
+                options.append(self.create_option(
+                    name, pk, labels[int(pk)], True, len(options)
+                ))
+        return [(None, options, 0)]
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(), required=False, label='Группа',
+        empty_label='без группы',
+    )
+
+
+def move_posts(queryset, group):
+    """Переносит посты в группу одним UPDATE, возвращает их число."""
+    group_id = group and group.pk
+    moved = queryset.exclude(group_id=group_id) if group_id else (
+        queryset.filter(group__isnull=False)
+    )
+    moved = moved.order_by()
+    with transaction.atomic():
+        # Сигналы post_save при update() не шлются: счётчики групп и теги
+        # кеша поправляем по сводке, снятой до переноса.
+        old_groups = list(moved.values('group_id', 'group__slug').annotate(
+            n=Count('pk')
+        ))
+        authors = set(moved.values_list('author_id', flat=True).distinct())
+        updated = moved.update(group_id=group_id)
+        for old in old_groups:
+            if old['group_id']:
+                counters.change_group(old['group_id'], -old['n'])
+        if group_id:
+            counters.change_group(group_id, updated)
+    tags = ['feed:index']
+    tags += [f'group:{old["group__slug"]}' for old in old_groups
+             if old['group__slug']]
+    tags += [f'author:{author_id}' for author_id in authors]
+    if group_id:
+        tags.append(f'group:{group.slug}')
+    invalidate(*tags)
+    return updated
+
+
+class ChangelistQuerySet(PostQuerySet):
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        # date_hierarchy выбирает годы через DISTINCT по всей таблице;
+        # вместо этого берём первую и последнюю дату — два шага по индексу.
+        if kind != 'year':
+            return super().datetimes(field_name, kind, order, tzinfo)
+        dates = self.order_by().values_list(field_name, flat=True)
+        first = dates.order_by(field_name).first()
+        last = dates.order_by('-' + field_name).first()
+        if first is None:
+            return []
+        years = range(timezone.localtime(first, tzinfo).year,
+                      timezone.localtime(last, tzinfo).year + 1)
+        if order == 'DESC':
+            years = reversed(years)
+        return [timezone.make_aware(datetime(year, 1, 1), tzinfo)
+                for year in years]
+
+
+class EstimatedCount(int):
+    """Число строк после порога пагинатора: выводится как «10000+»."""
+
+    def __str__(self):
+        return f'{settings.PAGINATION_COUNT_LIMIT}+'
+
+
+class EstimatedChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # «Выбрать все N» и подпись под списком не должны выдавать
+        # оценку за точное число.
+        if self.paginator.count_is_estimate:
+            self.result_count = EstimatedCount(self.result_count)
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -12,10 +127,68 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('group',)
+    raw_id_fields = ('author',)
     empty_value_display = '-пусто-'
+    # Точный COUNT(*) всей таблицы не нужен: хватает оценки пагинатора.
+    show_full_result_count = False
+    paginator = EstimatedPaginator
+    action_form = PostActionForm
+    actions = ('move_to_group', 'export_csv', 'export_ndjson')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return ChangelistQuerySet(
+            model=self.model, query=queryset.query, using=queryset.db
+        )
+
+    def get_changelist(self, request, **kwargs):
+        return EstimatedChangeList
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['widget'] = GroupSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'),
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def move_to_group(self, request, queryset):
+        # Поле action формы заполняется только при выводе списка, поэтому
+        # проверяем одно поле группы.
+        field = self.action_form.base_fields['group']
+        try:
+            group = field.clean(request.POST.get('group'))
+        except ValidationError:
+            self.message_user(request, 'Неизвестная группа.', messages.ERROR)
+            return
+        moved = move_posts(queryset, group)
+        self.message_user(request, f'Перенесено постов: {moved}.')
+    move_to_group.short_description = 'Перенести в выбранную группу'
+
+    def export_csv(self, request, queryset):
+        return exports.stream_csv(queryset, 'posts.csv')
+    export_csv.short_description = 'Выгрузить в CSV'
+
+    def export_ndjson(self, request, queryset):
+        return exports.stream_ndjson(queryset, 'posts.ndjson')
+    export_ndjson.short_description = 'Выгрузить в NDJSON'
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через полнотекстовый индекс, а не LIKE.
+        if not search_term:
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
+
+
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('title', 'slug', 'post_count')
+    search_fields = ('title', 'slug')
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
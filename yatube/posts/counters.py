@@ -0,0 +1,130 @@
+"""Денормализованные счётчики постов, подписок и комментариев.
+
+Сигналы меняют счётчики атомарным UPDATE ... SET n = n ± 1. Строка
+AuthorStats заводится лениво, при первом чтении или увеличении, и сразу
+считается по таблицам; расхождения исправляет команда reconcile_counters.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+
+def _change(queryset, **deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    # Счётчики беззнаковые: не уводим разошедшееся значение в минус.
+    for field, delta in deltas.items():
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**changes)
+
+
+def change_author(user_id, **deltas):
+    updated = _change(AuthorStats.objects.filter(user_id=user_id), **deltas)
+    # При уменьшении строку не заводим: пользователь может удаляться.
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        _create_stats(user_id)
+
+
+def change_group(group_id, delta):
+    _change(Group.objects.filter(pk=group_id), post_count=delta)
+
+
+def change_post(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), comment_count=delta)
+
+
+def _count_author(user_id):
+    return {
+        'post_count': Post.objects.filter(author_id=user_id).count(),
+        'follower_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def _create_stats(user_id):
+    # Savepoint: гонка за строку не должна ломать внешнюю транзакцию.
+    try:
+        with transaction.atomic():
+            return AuthorStats.objects.create(user_id=user_id,
+                                              **_count_author(user_id))
+    except IntegrityError:
+        return AuthorStats.objects.get(user_id=user_id)
+
+
+def author_stats(user):
+    """Счётчики автора; при первом обращении считаются по таблицам."""
+    try:
+        return AuthorStats.objects.get(user=user)
+    except AuthorStats.DoesNotExist:
+        return _create_stats(user.pk)
+
+
+def _pk_batches(queryset, batch_size):
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1]
+
+
+def _grouped_counts(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids}).order_by()
+        .values(field).annotate(n=Count('pk')).values_list(field, 'n')
+    )
+
+
+def _reconcile_column(model, field, source, source_field, batch_size):
+    fixed = 0
+    for batch in _pk_batches(model.objects.all(), batch_size):
+        counts = _grouped_counts(source, source_field, batch)
+        stale = [
+            model(pk=pk, **{field: counts.get(pk, 0)})
+            for pk, current in model.objects.filter(
+                pk__in=batch
+            ).values_list('pk', field)
+            if current != counts.get(pk, 0)
+        ]
+        model.objects.bulk_update(stale, [field])
+        fixed += len(stale)
+    return fixed
+
+
+def _reconcile_authors(batch_size):
+    fixed = 0
+    fields = ('post_count', 'follower_count', 'following_count')
+    for batch in _pk_batches(AuthorStats.objects.all(), batch_size):
+        counts = {
+            'post_count': _grouped_counts(Post.objects, 'author', batch),
+            'follower_count': _grouped_counts(Follow.objects, 'author',
+                                              batch),
+            'following_count': _grouped_counts(Follow.objects, 'user',
+                                               batch),
+        }
+        stale = []
+        for stats in AuthorStats.objects.filter(pk__in=batch):
+            actual = {field: counts[field].get(stats.pk, 0)
+                      for field in fields}
+            if any(getattr(stats, field) != actual[field]
+                   for field in fields):
+                stale.append(AuthorStats(pk=stats.pk, **actual))
+        AuthorStats.objects.bulk_update(stale, fields)
+        fixed += len(stale)
+    return fixed
+
+
+def reconcile(batch_size=1000):
+    """Пересчитывает все счётчики пачками, возвращает число исправлений."""
+    return {
+        'posts': _reconcile_column(Post, 'comment_count', Comment.objects,
+                                   'post', batch_size),
+        'groups': _reconcile_column(Group, 'post_count', Post.objects,
+                                    'group', batch_size),
+        'authors': _reconcile_authors(batch_size),
+    }
@@ -0,0 +1,72 @@
+"""ETag для лент и страницы поста.
+
+Валидатор собирается из версий тегов кеша (core.cache_tags), которые
+сигналы сдвигают при любом изменении постов, групп, комментариев и
+подписок, а также из пользователя и адреса страницы. Проверка стоит
+одного get_many к кешу и, где нужно, одного запроса по индексу: на 304
+запросы ленты и рендер шаблона не выполняются.
+
+Теги и их версии остаются в request.cache_tags: по ним страничный кеш
+(core.page_cache) узнаёт, что сохранённая страница устарела.
+"""
+import hashlib
+
+from django.contrib.auth import get_user_model
+
+from core.cache_tags import tags_version
+
+from .models import Follow, Post
+
+User = get_user_model()
+
+
+def _etag(request, *tags):
+    user = request.user
+    version = tags_version(*tags)
+    request.cache_tags = (tags, version)
+    raw = '|'.join((
+        str(user.pk if user.is_authenticated else 0),
+        request.get_full_path(),
+        version,
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def index_etag(request):
+    return _etag(request, 'feed:index')
+
+
+def group_etag(request, slug):
+    return _etag(request, f'group:{slug}')
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True).first()
+    if author_id is None:
+        return None
+    # follow:<id> сдвигается, когда автор сам подписывается или
+    # отписывается: на странице профиля есть число его подписок.
+    return _etag(request, f'author:{author_id}', f'follow:{author_id}')
+
+
+def post_etag(request, post_id):
+    author_id = Post.objects.filter(
+        pk=post_id
+    ).values_list('author_id', flat=True).first()
+    if author_id is None:
+        return None
+    return _etag(request, f'post:{post_id}', f'author:{author_id}')
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    author_ids = Follow.objects.filter(
+        user=request.user
+    ).values_list('author_id', flat=True)
+    return _etag(
+        request, f'follow:{request.user.pk}', 'groups',
+        *(f'author:{author_id}' for author_id in author_ids)
+    )
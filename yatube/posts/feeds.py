@@ -0,0 +1,215 @@
+"""Лента подписок.
+
+В режиме FOLLOW_FEED = 'timeline' каждый новый пост сразу раскладывается
+по материализованным лентам подписчиков (TimelineEntry), и чтение ленты
+сводится к выборке по индексу (user, post). Авторы, у которых больше
+FOLLOW_FANOUT_LIMIT подписчиков, не раскладываются: их посты
+подмешиваются при чтении, а когда автор опускается до порога, его посты
+раскладываются по лентам всех подписчиков в фоновом потоке. При подписке
+в ленту попадают только TIMELINE_BACKFILL_DEPTH последних постов автора.
+В режиме 'join' лента строится прежним JOIN.
+
+В режиме 'merge' у каждого автора в кеше лежит короткий список
+(pub_date, pk) его последних постов, общий для всех читателей. Страница
+ленты собирается слиянием списков авторов из подписок, и из базы
+догружаются только показываемые посты. Если списков не хватает до конца
+страницы, лента строится JOIN-ом.
+"""
+import heapq
+import logging
+import threading
+from itertools import dropwhile, islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import F, Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .utils import CursorPaginator, paginate
+
+logger = logging.getLogger(__name__)
+
+RECENT_POSTS_TIMEOUT = 60 * 60
+
+
+def timelines_enabled():
+    return settings.FOLLOW_FEED == 'timeline'
+
+
+def heavy_authors(author_ids):
+    """Авторы из списка, чьи посты не раскладываются по лентам."""
+    return list(AuthorStats.objects.filter(
+        user_id__in=author_ids,
+        follower_count__gt=settings.FOLLOW_FANOUT_LIMIT,
+    ).values_list('user_id', flat=True))
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    if heavy_authors([post.author_id]):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def _fill(follow):
+    posts = Post.objects.filter(
+        author_id=follow.author_id
+    ).order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date'
+    )[:settings.TIMELINE_BACKFILL_DEPTH]
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=follow.user_id, post_id=post_id,
+                       pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def _spawn(job):
+    threading.Thread(target=job, daemon=True).start()
+
+
+def refill(author_id):
+    """Раскладывает последние посты автора по лентам его подписчиков."""
+    try:
+        follows = Follow.objects.filter(author_id=author_id)
+        for follow in follows.iterator():
+            _fill(follow)
+    except Exception:
+        logger.exception('Не удалось разложить посты автора %s', author_id)
+    finally:
+        connections.close_all()
+
+
+def backfill(follow):
+    """Заполняет ленту нового подписчика постами автора."""
+    if heavy_authors([follow.author_id]):
+        return
+    _fill(follow)
+
+
+def prune(follow):
+    """Убирает из ленты посты автора, от которого отписались.
+
+    Если с этой отпиской автор перестал быть популярным, его посты,
+    которые до сих пор подмешивались при чтении, раскладываются по лентам
+    оставшихся подписчиков — после фиксации транзакции и не в запросе.
+    """
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+    became_light = AuthorStats.objects.filter(
+        user_id=follow.author_id,
+        follower_count=settings.FOLLOW_FANOUT_LIMIT,
+    ).exists()
+    if became_light:
+        author_id = follow.author_id
+        transaction.on_commit(lambda: _spawn(lambda: refill(author_id)))
+
+
+def follow_posts(user):
+    """Посты авторов, на которых подписан пользователь."""
+    if not timelines_enabled():
+        return Post.objects.for_feed().filter(author__following__user=user)
+    author_ids = Follow.objects.filter(
+        user=user
+    ).values_list('author_id', flat=True)
+    heavy = heavy_authors(list(author_ids))
+    if not heavy:
+        # Сортируем по полям записи ленты: тогда порядок даёт индекс
+        # (user, -pub_date, -post), без сортировки во временной таблице.
+        return Post.objects.for_feed().filter(
+            timeline_entries__user=user
+        ).annotate(
+            timeline_pub_date=F('timeline_entries__pub_date'),
+            timeline_post_id=F('timeline_entries__post_id'),
+        )
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.for_feed().filter(
+        Q(pk__in=entries) | Q(author_id__in=heavy)
+    )
+
+
+def recent_posts(author_ids):
+    """Списки (pub_date, pk) последних постов авторов, новые первыми."""
+    depth = settings.FOLLOW_MERGE_DEPTH
+    keys = {f'author_recent:{author_id}': author_id
+            for author_id in author_ids}
+    lists = cache.get_many(keys)
+    missing = {
+        key: list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-pk')
+            .values_list('pub_date', 'pk')[:depth]
+        )
+        for key, author_id in keys.items() if key not in lists
+    }
+    if missing:
+        cache.set_many(missing, RECENT_POSTS_TIMEOUT)
+        lists.update(missing)
+    return list(lists.values())
+
+
+def forget_recent(author_id):
+    cache.delete(f'author_recent:{author_id}')
+
+
+def merged_follow_page(user, after=None):
+    """Страница ленты слиянием кешированных списков или None."""
+    paginator = CursorPaginator(
+        Post.objects.for_feed().filter(author__following__user=user),
+        settings.PAGINATION,
+    )
+    per_page = paginator.per_page
+    author_ids = Follow.objects.filter(
+        user=user
+    ).values_list('author_id', flat=True)
+    lists = recent_posts(list(author_ids))
+    # Ниже последнего элемента обрезанного списка у автора могут быть
+    # посты, которых нет в кеше: такие ключи слиянию не доверяем.
+    bound = max(
+        (items[-1] for items in lists
+         if len(items) >= settings.FOLLOW_MERGE_DEPTH),
+        default=None,
+    )
+    merged = heapq.merge(*lists, reverse=True)
+    cursor = paginator.decode_cursor(after) if after else None
+    if cursor is not None and cursor[0] is not None:
+        merged = dropwhile(lambda key: key >= cursor, merged)
+    keys = list(islice(merged, per_page + 1))
+    if bound is None:
+        has_next = len(keys) > per_page
+    elif len(keys) > per_page and keys[per_page - 1] >= bound:
+        has_next = True
+    else:
+        return None
+    keys = keys[:per_page]
+    posts = Post.objects.for_feed().in_bulk([pk for _, pk in keys])
+    items = [posts[pk] for _, pk in keys if pk in posts]
+    return paginator.make_page(items, has_next=has_next,
+                               has_previous=cursor is not None)
+
+
+def follow_page(request):
+    """Страница ленты подписок в режиме из настройки FOLLOW_FEED."""
+    if (settings.FOLLOW_FEED == 'merge'
+            and not request.GET.get('page')
+            and not request.GET.get('before')):
+        page = merged_follow_page(request.user, request.GET.get('after'))
+        if page is not None:
+            return page
+    posts = follow_posts(request.user)
+    if 'timeline_pub_date' in posts.query.annotations:
+        return paginate(request, posts, key_field='timeline_pub_date',
+                        tie_field='timeline_post_id')
+    return paginate(request, posts)
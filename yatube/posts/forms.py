@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import Textarea
 
+from . import images
 from .models import Post, Comment
 
 
@@ -20,6 +22,13 @@ class PostForm(forms.ModelForm):
             'text': Textarea,
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Уже сохранённый файл или очистка поля — пережимать нечего.
+        if not isinstance(image, UploadedFile):
+            return image
+        return images.normalize(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,111 @@
+"""Приём картинок постов.
+
+Загрузка больше FILE_UPLOAD_MAX_MEMORY_SIZE уже пишется Django во
+временный файл по частям, поэтому в памяти остаётся только заголовок.
+Формат и размер проверяются по заголовку до декодирования. JPEG
+декодируется в режиме draft сразу в уменьшенном масштабе, а лимит
+IMAGE_MAX_PIXELS ограничивает то, что действительно будет распаковано.
+Оригинал поворачивается по EXIF и пережимается до IMAGE_MAX_SIDE, так что
+sorl-thumbnail потом тоже работает с небольшим файлом.
+
+Варианты картинки для srcset (ширина и формат из белого списка) строятся
+по первому запросу и складываются на диск в MEDIA_ROOT/IMAGE_VARIANT_DIR.
+"""
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, features
+
+EXIF_ORIENTATION = 0x0112
+
+
+def _reject(message):
+    raise ValidationError(message, code='invalid_image')
+
+
+def _open(upload):
+    if upload.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        _reject('Файл больше {} МБ.'.format(
+            settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+        ))
+    upload.seek(0)
+    try:
+        # Image.open читает только заголовок, пиксели ещё не декодированы.
+        image = Image.open(upload)
+    except (OSError, Image.DecompressionBombError):
+        _reject('Загрузите правильное изображение.')
+    if image.format not in settings.IMAGE_FORMATS:
+        _reject('Поддерживаются форматы: {}.'.format(
+            ', '.join(settings.IMAGE_FORMATS)
+        ))
+    return image
+
+
+def normalize(upload):
+    """Проверяет загруженную картинку и возвращает файл для хранения."""
+    image = _open(upload)
+    max_side = settings.IMAGE_MAX_SIDE
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if max(image.size) <= max_side and orientation == 1:
+        upload.seek(0)
+        return upload
+    # Для JPEG декодер сразу уменьшает картинку кратно 1/2..1/8.
+    image.draft('RGB', (max_side, max_side))
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        _reject('Слишком большое разрешение изображения.')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image, fmt, ext = image.convert('RGBA'), 'PNG', '.png'
+    else:
+        image, fmt, ext = image.convert('RGB'), 'JPEG', '.jpg'
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=settings.IMAGE_QUALITY, optimize=True)
+    name = os.path.splitext(os.path.basename(upload.name))[0] + ext
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), content_type=Image.MIME[fmt]
+    )
+
+
+def variant_formats():
+    """Форматы вариантов, которые умеет кодировать установленный Pillow."""
+    return [fmt for fmt in settings.IMAGE_VARIANT_FORMATS
+            if fmt != 'webp' or features.check('webp')]
+
+
+def variant_version(image_name):
+    return hashlib.md5(image_name.encode()).hexdigest()[:12]
+
+
+def variant_path(image_name, width, fmt):
+    return os.path.join(
+        settings.MEDIA_ROOT, settings.IMAGE_VARIANT_DIR,
+        variant_version(image_name), f'{width}.{fmt}'
+    )
+
+
+def render_variant(image_name, width, fmt):
+    """Путь к файлу варианта; при первом обращении вариант строится."""
+    path = variant_path(image_name, width, fmt)
+    if os.path.exists(path):
+        return path
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_RATIO
+    size = (width, round(width * ratio_height / ratio_width))
+    with default_storage.open(image_name) as source:
+        with Image.open(source) as image:
+            image.draft('RGB', size)
+            variant = ImageOps.fit(image.convert('RGB'), size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Пишем во временный файл: параллельный запрос не увидит половину.
+    # Имя своё у каждого потока, иначе два потока воркера пишут в один.
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    variant.save(temporary, fmt.upper(), quality=settings.IMAGE_QUALITY)
+    os.replace(temporary, path)
+    return path
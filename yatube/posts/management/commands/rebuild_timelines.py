@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает материализованные ленты подписок '
+            '(TIMELINE_BACKFILL_DEPTH последних постов каждого автора).')
+
+    def handle(self, *args, **options):
+        TimelineEntry.objects.all().delete()
+        follows = Follow.objects.all()
+        for follow in follows.iterator():
+            feeds.backfill(follow)
+        self.stdout.write(
+            f'Ленты пересобраны: {TimelineEntry.objects.count()} записей.'
+        )
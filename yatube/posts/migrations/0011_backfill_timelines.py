@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-17 12:10
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+
+def fill_timelines(apps, schema_editor):
+    # Подписки, оформленные до материализации лент, раскладываем так же,
+    # как feeds.backfill: посты популярных авторов подмешиваются при чтении.
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    heavy = Follow.objects.order_by().values('author_id').annotate(
+        n=Count('pk')
+    ).filter(n__gt=settings.FOLLOW_FANOUT_LIMIT).values('author_id')
+    follows = Follow.objects.exclude(author_id__in=heavy)
+    for follow in follows.iterator():
+        posts = Post.objects.filter(
+            author_id=follow.author_id
+        ).order_by('-pub_date', '-pk').values_list(
+            'pk', 'pub_date'
+        )[:settings.TIMELINE_BACKFILL_DEPTH]
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=follow.user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in posts),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+"""Полнотекстовый поиск по постам.
+
+В SQLite тексты постов индексирует таблица FTS5 posts_post_fts (миграция
+0010_post_search, синхронизация триггерами), а результаты упорядочены по
+BM25. На других базах поиск сводится к icontains без ранжирования.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+# Метки подсветки от highlight(): в тексте поста их не бывает, а после
+# экранирования HTML они заменяются тегами <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+MATCH_SQL = (
+    'posts_post.id IN '
+    '(SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s)'
+)
+RANK_SQL = (
+    'SELECT bm25(posts_post_fts) FROM posts_post_fts '
+    'WHERE posts_post_fts MATCH %s AND rowid = posts_post.id'
+)
+HIGHLIGHT_SQL = (
+    'SELECT rowid, highlight(posts_post_fts, 0, char(2), char(3)) '
+    'FROM posts_post_fts '
+    'WHERE posts_post_fts MATCH %s AND rowid IN ({marks})'
+)
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def fts_query(text):
+    """Запрос FTS5 из слов пользователя: все слова, последнее — префикс."""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def filter_posts(queryset, text):
+    """Посты из queryset, подходящие под запрос; без ранжирования."""
+    if not fts_enabled():
+        return queryset.filter(text__icontains=text)
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+    # pk__in=RawSQL(...) даёт IN ((SELECT ...)), а SQLite читает такие
+    # скобки как скалярный подзапрос и берёт только первую строку.
+    return queryset.extra(where=[MATCH_SQL], params=[query])
+
+
+def search_posts(text):
+    """Посты по запросу с рангом rank (меньше — лучше)."""
+    posts = filter_posts(Post.objects.for_feed(), text)
+    if not fts_enabled():
+        return posts.annotate(rank=Value(0.0, output_field=FloatField()))
+    return posts.annotate(
+        rank=RawSQL(RANK_SQL, [fts_query(text)], output_field=FloatField())
+    )
+
+
+def add_headlines(posts, text):
+    """Проставляет постам headline — текст с метками совпадений.
+
+    highlight() считается одним запросом только для переданных постов,
+    обычно для показываемой страницы.
+    """
+    posts = list(posts)
+    headlines = {}
+    if posts and fts_enabled():
+        marks = ', '.join(['%s'] * len(posts))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                HIGHLIGHT_SQL.format(marks=marks),
+                [fts_query(text), *(post.pk for post in posts)],
+            )
+            headlines = dict(cursor.fetchall())
+    for post in posts:
+        post.headline = headlines.get(post.pk, post.text)
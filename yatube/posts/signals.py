@@ -0,0 +1,172 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache_tags import invalidate
+
+from . import counters, feeds, thumbnails
+from .models import Comment, Follow, Group, Post, User
+
+DISPLAYED_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _names(user):
+    return tuple(getattr(user, field) for field in DISPLAYED_USER_FIELDS)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # При смене группы пост пропадает из старой ленты — её тоже сбросим.
+    if instance.pk:
+        instance._old_group = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'group__slug').first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    tags = [
+        'feed:index',
+        f'author:{instance.author_id}',
+        f'post:{instance.pk}',
+    ]
+    old_group_id, old_group_slug = getattr(
+        instance, '_old_group', None
+    ) or (None, None)
+    if old_group_slug:
+        tags.append(f'group:{old_group_slug}')
+    if instance.group_id:
+        tags.append(f'group:{instance.group.slug}')
+    invalidate(*tags)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    invalidate('feed:index', f'group:{instance.slug}', 'groups')
+
+
+@receiver(pre_save, sender=User)
+def remember_names(sender, instance, update_fields=None, **kwargs):
+    # Сбрасывать кеш стоит, только если поменялось видимое имя; вход в
+    # систему, смена пароля и прочие сохранения карточек не трогают.
+    instance._old_names = None
+    if not instance.pk:
+        return
+    if update_fields is not None and set(update_fields).isdisjoint(
+        DISPLAYED_USER_FIELDS
+    ):
+        instance._old_names = _names(instance)
+        return
+    instance._old_names = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*DISPLAYED_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, **kwargs):
+    # Имя автора есть в карточках его постов, а карточки — в лентах,
+    # где он публиковался; имя комментатора — во фрагментах комментариев
+    # под постами. У нового пользователя закешированного ничего нет.
+    old_names = getattr(instance, '_old_names', None)
+    if created or old_names is None or old_names == _names(instance):
+        return
+    slugs = Group.objects.filter(
+        posts__author=instance
+    ).values_list('slug', flat=True).distinct()
+    post_ids = Comment.objects.filter(
+        author=instance
+    ).values_list('post_id', flat=True).distinct()
+    invalidate('feed:index', f'author:{instance.pk}',
+               *(f'group:{slug}' for slug in slugs),
+               *(f'post:{post_id}' for post_id in post_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    if instance.post_id:
+        invalidate(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    invalidate(f'follow:{instance.user_id}', f'author:{instance.author_id}')
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_author(instance.author_id, post_count=1)
+        if instance.group_id:
+            counters.change_group(instance.group_id, 1)
+        return
+    old_group_id = (getattr(instance, '_old_group', None) or (None,))[0]
+    if old_group_id != instance.group_id:
+        if old_group_id:
+            counters.change_group(old_group_id, -1)
+        if instance.group_id:
+            counters.change_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, post_count=-1)
+    if instance.group_id:
+        counters.change_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created and instance.post_id:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if instance.post_id:
+        counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_author(instance.author_id, follower_count=1)
+        counters.change_author(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, follower_count=-1)
+    counters.change_author(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        feeds.forget_recent(instance.author_id)
+        if feeds.timelines_enabled():
+            feeds.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def forget_recent_posts(sender, instance, **kwargs):
+    feeds.forget_recent(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and feeds.timelines_enabled():
+        feeds.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    if feeds.timelines_enabled():
+        feeds.prune(instance)
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(sender, instance, **kwargs):
+    thumbnails.pregenerate(instance)
@@ -0,0 +1,41 @@
+from django import template
+from django.conf import settings
+from django.urls import reverse
+
+from posts import images, thumbnails
+from posts.models import Post
+
+register = template.Library()
+
+
+@register.simple_tag
+def resolve_thumbnails(posts, geometry_string, **options):
+    """{% resolve_thumbnails page_obj "960x339" %} -> post.thumb_url."""
+    if isinstance(posts, Post):
+        posts = [posts]
+    thumbnails.resolve(posts, geometry_string, **options)
+    return ''
+
+
+@register.inclusion_tag('posts/picture.html')
+def post_picture(post):
+    """<picture> со srcset вариантов картинки поста."""
+    if not post.image:
+        return {}
+    version = images.variant_version(post.image.name)
+
+    def url(width, fmt):
+        return reverse('posts:image_variant', kwargs={
+            'post_id': post.pk, 'width': width, 'fmt': fmt,
+        }) + f'?v={version}'
+
+    sources = [{
+        'type': f'image/{fmt}',
+        'srcset': ', '.join(f'{url(width, fmt)} {width}w'
+                            for width in settings.IMAGE_VARIANT_WIDTHS),
+    } for fmt in images.variant_formats()]
+    return {
+        'src': getattr(post, 'thumb_url', None) or url(960, 'jpeg'),
+        'sources': sources,
+        'sizes': settings.IMAGE_VARIANT_SIZES,
+    }
@@ -0,0 +1,52 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.cache_tags import get_versions
+from posts import thumbnails
+
+register = template.Library()
+
+
+def _card_tags(post):
+    tags = [f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id:
+        tags.append(f'group:{post.group.slug}')
+    return tags
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Карточки постов из общего кеша: одна на пост и версию его тегов.
+
+    Версии тегов всех постов и готовые карточки читаются двумя get_many,
+    рендерятся только недостающие карточки. Возвращает список HTML
+    карточек в порядке постов.
+    """
+    posts = list(posts)
+    tags = {post.pk: _card_tags(post) for post in posts}
+    unique = sorted({tag for post_tags in tags.values() for tag in post_tags})
+    versions = dict(zip(unique, get_versions(*unique)))
+    keys = {}
+    for post in posts:
+        raw = '.'.join(str(versions[tag]) for tag in tags[post.pk])
+        keys[post.pk] = (f'post_card:{post.pk}:'
+                         + hashlib.md5(raw.encode()).hexdigest())
+    cards = cache.get_many(keys.values())
+    missing = [post for post in posts if keys[post.pk] not in cards]
+    if missing:
+        # Первая геометрия из THUMBNAIL_PREGENERATE — миниатюра ленты.
+        geometry, options = settings.THUMBNAIL_PREGENERATE[0]
+        thumbnails.resolve(missing, geometry, **options)
+        rendered = {
+            keys[post.pk]: render_to_string('posts/post_card.html',
+                                            {'post': post})
+            for post in missing
+        }
+        cache.set_many(rendered, settings.POST_CARD_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[keys[post.pk]]) for post in posts]
@@ -0,0 +1,16 @@
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.search import MARK_END, MARK_START
+
+register = template.Library()
+
+
+@register.filter
+def highlight(value):
+    """Экранирует текст и превращает метки поиска в <mark>."""
+    return mark_safe(
+        escape(value).replace(MARK_START, '<mark>').replace(MARK_END,
+                                                            '</mark>')
+    )
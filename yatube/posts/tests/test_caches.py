@@ -0,0 +1,326 @@
+import json
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import cache_tags
+from core.budget_cache import BudgetCache
+from core.sqlite_cache import SQLiteCache
+from core.tiered_cache import TieredCache
+
+TEMP_CACHE_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SQLITE_CACHE = {
+    'BACKEND': 'core.sqlite_cache.SQLiteCache',
+    'LOCATION': TEMP_CACHE_DIR + '/cache.sqlite3',
+}
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'LOCATION': 'worker-1',
+        'OPTIONS': {'L1': 'local', 'L2': 'shared', 'SYNC_INTERVAL': 60},
+    },
+    'local': {
+        'BACKEND': 'core.budget_cache.BudgetCache',
+        'LOCATION': 'worker-1-l1',
+    },
+    'local2': {
+        'BACKEND': 'core.budget_cache.BudgetCache',
+        'LOCATION': 'worker-2-l1',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-l2',
+    },
+}
+
+
+def tearDownModule():
+    shutil.rmtree(TEMP_CACHE_DIR, ignore_errors=True)
+
+
+@override_settings(CACHES={'default': SQLITE_CACHE})
+class SQLiteCacheTests(TestCase):
+    """Общий для процессов кеш в файле SQLite."""
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра видна другому, как другому процессу."""
+        self.cache.set('key', {'value': [1, 2]})
+        other = SQLiteCache(SQLITE_CACHE['LOCATION'], {})
+        self.assertEqual(other.get('key'), {'value': [1, 2]})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_many_and_incr(self):
+        """get_many, set_many, incr и версии ключей."""
+        self.cache.set_many({'a': 1, 'b': None})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': None})
+        self.assertEqual(self.cache.incr('a', 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('c')
+        self.cache.set('a', 'v2', version=2)
+        self.assertEqual(self.cache.get('a'), 6)
+        self.assertEqual(self.cache.incr_version('a', version=2), 3)
+        self.assertEqual(self.cache.get('a', version=3), 'v2')
+
+    def test_expiry_and_add(self):
+        """Просроченная запись не отдаётся и уступает место add."""
+        self.cache.set('key', 'old', 0.05)
+        self.assertFalse(self.cache.add('key', 'new'))
+        time.sleep(0.1)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+        self.assertTrue(self.cache.touch('key', None))
+        self.assertFalse(self.cache.touch('missing'))
+
+    def test_cull(self):
+        """Сверх MAX_ENTRIES удаляются записи с ближайшим сроком."""
+        store = self.cache._store
+        store.set_many({f'k{i}': i for i in range(10)}, time.time() + 60)
+        store.set('forever', 'x')
+        store.cull(max_entries=5, cull_frequency=2)
+        self.assertEqual(len(store.keys()), 6)
+        self.assertIn('forever', store.keys())
+
+    def test_entry_count(self):
+        """Счётчик записей сходится с таблицей после любых операций."""
+        store = self.cache._store
+        self.cache.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.cache.set('a', 'заменён')
+        self.cache.add('d', 4)
+        self.cache.add('d', 5)
+        self.cache.delete('b')
+        self.cache.set('e', 5, 0.01)
+        time.sleep(0.02)
+        self.cache.add('e', 6)
+        self.assertEqual(store.count(), len(store.keys()))
+        self.assertEqual(store.count(), 4)
+        self.cache.clear()
+        self.assertEqual(store.count(), 0)
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTests(TestCase):
+    """L1 в процессе перед общим кешем."""
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        # Второй «процесс»: свой L1 с тем же L2.
+        self.other = TieredCache('worker-2', {'OPTIONS': {
+            'L1': 'local2', 'L2': 'shared', 'SYNC_INTERVAL': 60,
+        }})
+        self.other.clear()
+
+    def sync(self, *backends):
+        for backend in backends:
+            backend._state['synced'] = 0.0
+            backend._sync()
+
+    def test_l1_hit_skips_l2(self):
+        """Повторное чтение не обращается к общему кешу."""
+        caches['shared'].set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+        with mock.patch.object(TieredCache, 'l2') as l2:
+            self.assertEqual(self.cache.get('key'), 'value')
+            self.assertEqual(self.cache.get_many(['key']), {'key': 'value'})
+        l2.get.assert_not_called()
+        l2.get_many.assert_not_called()
+
+    def test_invalidation_reaches_other_l1(self):
+        """incr и delete в одном процессе видны другому после сверки."""
+        self.cache.set('version', 1)
+        self.cache.set('page', 'old')
+        self.assertEqual(self.other.get('version'), 1)
+        self.assertEqual(self.other.get('page'), 'old')
+        self.cache.incr('version')
+        self.cache.delete('page')
+        self.assertEqual(self.other.get('version'), 1)
+        self.sync(self.other)
+        self.assertEqual(self.other.get('version'), 2)
+        self.assertIsNone(self.other.get('page'))
+
+    def test_locks_skip_l1(self):
+        """Блокировки живут только в L2, их снятие не рассылается."""
+        self.assertTrue(self.cache.add('key:lock', 1))
+        self.assertFalse(self.other.add('key:lock', 1))
+        self.assertIsNone(caches['local'].get('key:lock'))
+        shared = caches['shared']
+        with mock.patch.object(shared, 'incr') as incr, \
+                mock.patch.object(shared, 'set') as set_:
+            self.cache.delete('key:lock')
+        incr.assert_not_called()
+        set_.assert_not_called()
+        self.assertTrue(self.other.add('key:lock', 1))
+
+    def test_stats_command(self):
+        """cache_stats показывает попадания по уровням."""
+        self.cache.set('key', 'value')
+        self.cache.get('key')
+        self.other.get('key')
+        self.other.get('missing')
+        self.sync(self.cache, self.other)
+        self.assertEqual(self.cache.stats(), {
+            'l1': {'hits': 1, 'misses': 2},
+            'l2': {'hits': 1, 'misses': 1},
+        })
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn('default l1: попаданий 1, промахов 2, доля 33.3%',
+                      out.getvalue())
+
+
+BUDGET_CACHE = {
+    'BACKEND': 'core.budget_cache.BudgetCache',
+    'LOCATION': 'budget',
+    'OPTIONS': {'MAX_BYTES': 1000},
+}
+
+
+@override_settings(CACHES={'default': BUDGET_CACHE})
+class BudgetCacheTests(TestCase):
+    """Кеш процесса с бюджетом в байтах."""
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+        # clear() счётчики не сбрасывает: тесты не должны видеть чужие.
+        self.cache._state['stats'].clear()
+        self.value = 'x' * 100
+
+    def test_lru_within_budget(self):
+        """Сверх бюджета вытесняется давно не читанная запись."""
+        for key in ('a', 'b', 'c', 'd'):
+            self.cache.set(key, self.value)
+        self.assertIsNone(self.cache.get('a'))
+        for key in ('b', 'c', 'd'):
+            self.assertEqual(self.cache.get(key), self.value)
+        self.assertLessEqual(self.cache._state['bytes'], 1000)
+        self.assertEqual(self.cache.stats()['a']['evictions'], 1)
+        self.cache.set('huge', 'x' * 1000)
+        self.assertIsNone(self.cache.get('huge'))
+
+    def test_rare_key_not_admitted(self):
+        """Редкий ключ не вытесняет часто читаемые (TinyLFU)."""
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, self.value)
+            for _ in range(3):
+                self.cache.get(key)
+        self.cache.set('rare', self.value)
+        self.assertIsNone(self.cache.get('rare'))
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {
+            key: self.value for key in ('a', 'b', 'c')
+        })
+        self.assertEqual(self.cache.stats()['rare']['rejected'], 1)
+
+    def test_admission_against_first_victim(self):
+        """Новый ключ сравнивается с первой жертвой, а не со всеми."""
+        self.cache.set('cold', self.value)
+        for key in ('warm', 'kept'):
+            self.cache.set(key, self.value)
+            for _ in range(3):
+                self.cache.get(key)
+        # Большой записи нужно место двух жертв: холодной и горячей.
+        self.cache.set('wide', 'x' * 400)
+        self.assertIsNotNone(self.cache.get('wide'))
+        self.assertIsNone(self.cache.get('cold'))
+        self.assertIsNone(self.cache.get('warm'))
+        self.assertEqual(self.cache.get('kept'), self.value)
+        stats = self.cache.stats()
+        self.assertEqual(stats['cold']['evictions'], 1)
+        self.assertEqual(stats['warm']['evictions'], 1)
+
+    def test_rejection_evicts_nothing(self):
+        """Отклонённый ключ не вытесняет ни одной записи."""
+        for key in ('hot4', 'hot5', 'hot6'):
+            self.cache.set(key, self.value)
+            for _ in range(3):
+                self.cache.get(key)
+        self.cache.set('cold2', 'x' * 400)
+        self.assertIsNone(self.cache.get('cold2'))
+        self.assertEqual(len(self.cache.get_many(['hot4', 'hot5', 'hot6'])),
+                         3)
+        stats = self.cache.stats()
+        self.assertFalse(any(stats[key]['evictions']
+                             for key in ('hot4', 'hot5', 'hot6')))
+
+    def test_add_always_admitted(self):
+        """add() не отклоняется TinyLFU: через него берут блокировки."""
+        for key in ('hot1', 'hot2', 'hot3'):
+            self.cache.set(key, self.value)
+            for _ in range(3):
+                self.cache.get(key)
+        self.assertTrue(self.cache.add('rare:lock', self.value))
+        self.assertFalse(self.cache.add('rare:lock', self.value))
+
+    def test_versions_survive_dropped_add(self):
+        """Версия тега, которую кеш не удержал, не роняет get_versions."""
+        with mock.patch.object(caches['default'], 'add',
+                               return_value=False):
+            versions = cache_tags.get_versions('feed:index', 'post:1')
+        self.assertEqual(len(versions), 2)
+        self.assertTrue(all(isinstance(version, int)
+                            for version in versions))
+
+    def test_clear_keeps_counters(self):
+        """Очистка обнуляет занятое место, но не попадания и промахи."""
+        self.cache.set('post_card:1', 'card')
+        self.cache.get('post_card:1')
+        self.cache.get('post_card:2')
+        self.cache.clear()
+        row = self.cache.stats()['post_card']
+        self.assertEqual((row['hits'], row['misses']), (1, 1))
+        self.assertEqual((row['bytes'], row['entries']), (0, 0))
+
+    def test_incr_and_expiry(self):
+        """incr сохраняет срок, просроченная запись не отдаётся."""
+        self.cache.set('counter', 1, 0.05)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.cache.get('counter'), 3)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('counter'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+
+    def test_prefix_stats_command(self):
+        """cache_stats показывает счётчики по префиксам ключей."""
+        self.cache.get('post_card:1:v')
+        self.cache.set('post_card:1:v', 'card')
+        self.cache.get('post_card:1:v')
+        out = StringIO()
+        call_command('cache_stats', stdout=out)
+        self.assertIn(
+            'default post_card: попаданий 1, промахов 1, доля 50.0%, '
+            'вытеснено 0, не принято 0, байт ', out.getvalue()
+        )
+
+    def test_stats_from_all_processes(self):
+        """Сводки живых процессов суммируются, устаревшие удаляются."""
+        cache = BudgetCache('budget', {'OPTIONS': {
+            'MAX_BYTES': 1000,
+            'STATS_PATH': TEMP_CACHE_DIR + '/stats.sqlite3',
+        }})
+        cache.get('post_card:1')
+        store = cache._stats_store
+        store.set('budget:1', json.dumps({
+            'time': time.time(), 'rows': {'post_card': {'hits': 4}},
+        }))
+        store.set('budget:2', json.dumps({
+            'time': 0, 'rows': {'post_card': {'hits': 100}},
+        }))
+        row = cache.stats()['post_card']
+        self.assertEqual((row['hits'], row['misses']), (4, 1))
+        self.assertNotIn('budget:2', store.keys())
@@ -1,12 +1,15 @@
 from http import HTTPStatus
+from io import BytesIO
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 import shutil
 import tempfile
 
+from PIL import Image
+
 from ..forms import PostForm
 from ..models import Group, Post
 
@@ -151,3 +154,51 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.count(), posts_count)
         self.assertFalse(Post.objects.filter(text='Изменяем текст').exists())
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+def make_image(size, fmt='JPEG', orientation=None, name='photo.jpg'):
+    buffer = BytesIO()
+    image = Image.new('RGB', size, (200, 30, 30))
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buffer, fmt, exif=exif.tobytes())
+    return SimpleUploadedFile(name, buffer.getvalue(), f'image/{fmt.lower()}')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=100,
+                   IMAGE_MAX_PIXELS=200 * 100)
+class ImageUploadTests(TestCase):
+    """Загруженная картинка проверяется и пережимается."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def clean_image(self, upload):
+        form = PostForm(data={'text': 'Текст'}, files={'image': upload})
+        form.is_valid()
+        return form
+
+    def test_large_image_is_downscaled(self):
+        """Большой оригинал уменьшается и поворачивается по EXIF."""
+        form = self.clean_image(make_image((400, 200), orientation=6))
+        self.assertTrue(form.is_valid(), form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_small_image_is_kept(self):
+        """Картинка в пределах лимитов сохраняется как есть."""
+        upload = make_image((80, 60))
+        form = self.clean_image(upload)
+        self.assertIs(form.cleaned_data['image'], upload)
+
+    def test_oversized_images_rejected(self):
+        """Слишком большие файл и разрешение отклоняются до декодирования."""
+        png = make_image((400, 400), fmt='PNG', name='huge.png')
+        self.assertIn('image', self.clean_image(png).errors)
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=10):
+            form = self.clean_image(make_image((80, 60)))
+        self.assertIn('image', form.errors)
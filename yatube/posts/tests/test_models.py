@@ -1,6 +1,10 @@
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post, User
+from ..counters import _create_stats, author_stats
+from ..models import Comment, Follow, Group, Post, User
 
 
 class PostModelTest(TestCase):
@@ -27,3 +31,54 @@ class PostModelTest(TestCase):
         for value, expected in vals:
             with self.subTest(value=value):
                 self.assertEqual(value, expected)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counted')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='counted', description='Описание'
+        )
+
+    def test_signals_keep_counters(self):
+        """Счётчики меняются вместе с постами, подписками и комментариями."""
+        post = Post.objects.create(author=self.author, text='Пост',
+                                   group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        Follow.objects.create(user=self.reader, author=self.author)
+        stats = author_stats(self.author)
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(
+            (stats.post_count, stats.follower_count, self.group.post_count,
+             post.comment_count, author_stats(self.reader).following_count),
+            (1, 1, 1, 1, 1)
+        )
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 0)
+        post.delete()
+        Follow.objects.all().delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.post_count, stats.follower_count), (0, 0))
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        author_stats(self.author)
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}', group=self.group)
+            for i in range(3)
+        )
+        call_command('reconcile_counters', batch_size=2, stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.post_count, 3)
+        self.assertEqual(author_stats(self.author).post_count, 3)
+
+    def test_create_stats_race(self):
+        """Проигравший гонку за строку счётчиков читает готовую."""
+        stats = author_stats(self.author)
+        self.assertEqual(_create_stats(self.author.pk), stats)
@@ -0,0 +1,142 @@
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
+
+from core.cache_tags import tags_version
+
+from .. import thumbnails
+from ..models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+KVSTORE_PATH = TEMP_MEDIA_ROOT + '/thumbnails.sqlite3'
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    """Миниатюры строятся заранее, рендер их только ищет."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='painter'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('thumb.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.geometry, self.options = settings.THUMBNAIL_PREGENERATE[0]
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_generate_fills_kvstore(self):
+        """Построенная миниатюра попадает в KV-хранилище."""
+        thumbnails.generate(self.post.image.name)
+        with mock.patch.object(ThumbnailBackend, '_create_thumbnail') as make:
+            thumbnail = ThumbnailBackend().get_thumbnail(
+                self.post.image.name, self.geometry, **self.options
+            )
+        make.assert_not_called()
+        self.assertEqual(default.kvstore.get(thumbnail).name, thumbnail.name)
+
+    def test_queued_backend_does_not_render(self):
+        """Без готовой миниатюры отдаётся оригинал, построение в очереди."""
+        backend = thumbnails.QueuedThumbnailBackend()
+        with mock.patch.object(thumbnails, 'generate') as generate:
+            image = backend.get_thumbnail(
+                self.post.image.name, self.geometry, **self.options
+            )
+        self.assertEqual(image.name, self.post.image.name)
+        generate.assert_called_once_with(
+            self.post.image.name, [(self.geometry, self.options)]
+        )
+        with override_settings(THUMBNAIL_WORKERS=0):
+            thumbnails.generate(self.post.image.name)
+        cache.clear()
+        image = backend.get_thumbnail(
+            self.post.image.name, self.geometry, **self.options
+        )
+        self.assertNotEqual(image.name, self.post.image.name)
+
+    def test_done_invalidates_post(self):
+        """Готовые миниатюры сбрасывают закешированные карточки поста."""
+        version = tags_version(f'post:{self.post.pk}')
+        future = Future()
+        future.set_result([])
+        with mock.patch.object(thumbnails, 'connections'):
+            thumbnails._forget_misses(self.post.image.name, future)
+        self.assertNotEqual(tags_version(f'post:{self.post.pk}'), version)
+
+    @override_settings(THUMBNAIL_KVSTORE_PATH=KVSTORE_PATH)
+    def test_disk_kvstore(self):
+        """Записи на диске видны новому экземпляру хранилища."""
+        source = ImageFile(self.post.image.name)
+        source.set_size([2, 1])
+        thumbnails.DiskKVStore().set(source)
+        store = thumbnails.DiskKVStore()
+        self.assertEqual(store.get(source).size, [2, 1])
+        self.assertEqual(list(store._find_keys('image')), [source.key])
+        store.delete(source)
+        self.assertIsNone(thumbnails.DiskKVStore().get(source))
+
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_resolve_page(self):
+        """Миниатюры страницы читаются пакетом и попадают в ленту."""
+        thumbnails.generate(self.post.image.name)
+        cache.clear()
+        posts = list(Post.objects.all())
+        with mock.patch.object(ThumbnailBackend, 'get_thumbnail') as get:
+            with self.assertNumQueries(1):
+                thumbnails.resolve(posts, self.geometry, **self.options)
+        get.assert_not_called()
+        self.assertIn('/cache/', posts[0].thumb_url)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, posts[0].thumb_url)
+
+    def test_image_variant(self):
+        """Вариант картинки строится один раз и кешируется браузером."""
+        url = reverse('posts:image_variant', kwargs={
+            'post_id': self.post.pk, 'width': 480, 'fmt': 'jpeg',
+        })
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content)[:2],
+                         b'\xff\xd8')
+        response.close()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        for width, fmt in ((500, 'jpeg'), (480, 'bmp')):
+            response = self.client.get(reverse('posts:image_variant', kwargs={
+                'post_id': self.post.pk, 'width': width, 'fmt': fmt,
+            }))
+            self.assertEqual(response.status_code, 404)
+
+    def test_feed_srcset(self):
+        """Лента отдаёт srcset со всеми ширинами вариантов."""
+        response = self.client.get(reverse('posts:index'))
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            self.assertContains(response, f'/image/{width}.jpeg?v=')
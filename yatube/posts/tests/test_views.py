@@ -1,16 +1,28 @@
+import gzip
 import shutil
 import tempfile
+import time
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template import Context, Template
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core import page_cache, stampede, template_cache
+from core.cache_tags import tags_version
+
+from .. import counters, feeds
 from ..forms import PostForm
-from ..models import Comment, Follow, Group, Post
+from ..models import Comment, Follow, Group, Post, TimelineEntry
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -145,13 +157,43 @@ class PostPageTests(TestCase):
 
     def test_cache(self):
         """Тест кеширования"""
+        cache.clear()
         response = self.guest_client.get(reverse("posts:index"))
         key1 = response.content
-        Post.objects.get(id=1).delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         response2 = self.guest_client.get(reverse("posts:index"))
         key2 = response2.content
         self.assertEqual(key1, key2)
 
+    def test_cache_invalidation(self):
+        """Новый пост сразу виден в закешированных лентах."""
+        cache.clear()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        )
+        for url in urls:
+            self.guest_client.get(url)
+        Post.objects.create(
+            text='Свежий пост', author=self.author, group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_cache_per_page(self):
+        """Фрагмент ленты кешируется отдельно для каждой страницы."""
+        cache.clear()
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author)
+            for i in range(settings.PAGINATION)
+        )
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(reverse('posts:index'), {'page': 2})
+        self.assertNotContains(first, self.post.text)
+        self.assertContains(second, self.post.text)
+
     def test_comment(self):
         """Тест коммента."""
         comments_count = Comment.objects.count()
@@ -169,6 +211,51 @@ class PostPageTests(TestCase):
         self.assertTrue(Comment.objects.filter(text="Тестовый коммент")
                         .exists())
 
+    @override_settings(COMMENTS_PAGINATION=2)
+    def test_post_detail_comments(self):
+        """На странице поста только его комментарии, по порядку и частями."""
+        other_post = Post.objects.create(author=self.author, text='Другой')
+        Comment.objects.create(post=other_post, author=self.author,
+                               text='Чужой')
+        comments = [
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text=f'Коммент {i}')
+            for i in range(3)
+        ]
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.guest_client.get(url)
+        first_page = response.context['comments']
+        self.assertEqual(list(first_page), comments[:2])
+        self.assertEqual(response.context['comment_count'], 3)
+        response = self.guest_client.get(
+            url, {'comments_after': first_page.next_cursor}
+        )
+        self.assertEqual(list(response.context['comments']), comments[2:])
+        self.assertIsNone(response.context['comments'].next_cursor)
+
+    def test_cached_comments_skip_query(self):
+        """Фрагмент комментариев из кеша не выбирает комментарии."""
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Коммент')
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'Коммент')
+        self.assertFalse(any('FROM "posts_comment"' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_commenter_rename_invalidates_comments(self):
+        """Новое имя комментатора сразу видно под постом."""
+        commenter = User.objects.create_user(username='commenter')
+        Comment.objects.create(post=self.post, author=commenter,
+                               text='Коммент')
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        commenter.username = 'renamed'
+        commenter.save()
+        self.assertContains(self.guest_client.get(url), 'renamed')
+
     def test_follow(self):
         """Проверяю подписку на автора."""
         test_author = User.objects.create(username="skala")
@@ -226,8 +313,10 @@ class PaginatorViewsTest(TestCase):
             )
             )
         Post.objects.bulk_create(cls.posts)
+        counters.reconcile()
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.author = User.objects.get(username='test_username')
         self.authorized_client = Client()
@@ -247,6 +336,111 @@ class PaginatorViewsTest(TestCase):
                 settings.PAGINATION
             )
 
+    def test_cursor_paginator(self):
+        """Курсорная пагинация не сдвигается при добавлении постов."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first_page = self.client.get(url).context['page_obj']
+        cursor = first_page.next_cursor
+        self.assertIsNotNone(cursor)
+        second_page = self.client.get(url, {'after': cursor}).context[
+            'page_obj']
+        self.assertEqual(len(second_page.object_list), 3)
+        self.assertIsNone(second_page.next_cursor)
+        Post.objects.create(
+            text='Новый пост', author=self.author, group=self.group
+        )
+        response = self.client.get(url, {'after': cursor})
+        self.assertEqual(
+            response.context['page_obj'].object_list,
+            second_page.object_list
+        )
+        previous_page = self.client.get(
+            url, {'before': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(previous_page.object_list,
+                         first_page.object_list)
+
+    @override_settings(PAGINATION=1, PAGINATION_WINDOW=2)
+    def test_page_window(self):
+        """В шаблон попадает только окно номеров вокруг текущей страницы."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.client.get(url, {'page': 7})
+        self.assertEqual(
+            list(response.context['page_obj'].page_window), [5, 6, 7, 8, 9]
+        )
+        self.assertNotContains(response, '?page=4"')
+
+    def test_count_is_cached(self):
+        """Количество постов берётся из кеша, а не из COUNT(*)."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(text='Ещё пост', author=self.author)
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+
+    @override_settings(PAGINATION_COUNT_LIMIT=5)
+    def test_count_estimate(self):
+        """После порога количество только оценивается."""
+        paginator = self.client.get(
+            reverse('posts:index')
+        ).context['page_obj'].paginator
+        self.assertEqual(paginator.count, 6)
+        self.assertTrue(paginator.count_is_estimate)
+
+    def test_fragment_key_ignores_extra_params(self):
+        """Посторонние параметры адреса не плодят копии фрагмента ленты."""
+        keys = []
+
+        def get_or_compute(key, compute, timeout):
+            keys.append(key)
+            return stampede.get_or_compute(key, compute, timeout)
+
+        with mock.patch('core.templatetags.cache_tags.get_or_compute',
+                        get_or_compute):
+            for params in ({}, {'utm': 'a'}, {'page': '1', 'utm': 'b'},
+                           {'page': 'x'}):
+                self.client.get(reverse('posts:index'), params)
+        self.assertEqual(len(set(keys)), 1)
+
+    @override_settings(PAGINATION_COUNT_LIMIT=5, PAGINATION=2)
+    def test_pages_beyond_estimate(self):
+        """Номер страницы за оценкой не сводится к последней по оценке."""
+        url = reverse('posts:index')
+        page = self.client.get(url, {'page': 5}).context['page_obj']
+        self.assertEqual(page.number, 5)
+        self.assertEqual(len(page.object_list), 2)
+        self.assertTrue(page.has_next())
+        self.assertIsNotNone(page.next_cursor)
+        page = self.client.get(url, {'page': 7}).context['page_obj']
+        self.assertEqual(len(page.object_list), 1)
+        self.assertFalse(page.has_next())
+        page = self.client.get(url, {'page': 8}).context['page_obj']
+        self.assertEqual(page.number, 3)
+
+    def test_feed_queries_do_not_grow(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        cache.clear()
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(url)
+        Post.objects.filter(
+            pk__in=Post.objects.order_by('pk').values('pk')[1:]
+        ).delete()
+        cache.clear()
+        with CaptureQueriesContext(connection) as one_post:
+            self.client.get(url)
+        self.assertEqual(len(full_page), len(one_post))
+
+    def test_cursor_paginator_bad_token(self):
+        """Битый курсор отдаёт первую страницу."""
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        response = self.client.get(url, {'after': 'не-курсор'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            len(response.context['page_obj'].object_list),
+            settings.PAGINATION
+        )
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class TaskPagesTests(TestCase):
@@ -317,3 +511,583 @@ class TaskPagesTests(TestCase):
             Post.objects.filter(text="Тестовый текст",
                                 image="posts/small.gif").exists()
         )
+
+
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(text='Старый пост',
+                                           author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def follow_feed(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'].object_list)
+
+    def test_timeline_fan_out(self):
+        """Подписка заполняет ленту, новый пост попадает в неё сразу."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader,
+                                         post=self.old_post).exists()
+        )
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.follow_feed(), [new_post, self.old_post])
+
+    def test_timeline_prune(self):
+        """Отписка убирает посты автора из ленты."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader)
+                         .exists())
+        self.assertEqual(self.follow_feed(), [])
+
+    @override_settings(FOLLOW_FANOUT_LIMIT=0)
+    def test_heavy_author_fan_out_on_read(self):
+        """Посты популярных авторов подмешиваются при чтении."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_feed(), [new_post, self.old_post])
+
+    @override_settings(FOLLOW_FANOUT_LIMIT=1)
+    def test_author_becomes_light(self):
+        """Посты, написанные, пока автор был популярным, не теряются."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='other_reader')
+        follow = Follow.objects.create(user=other, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=new_post).exists())
+        # Раскладка идёт после фиксации в фоновом потоке; здесь — сразу.
+        with mock.patch('django.db.transaction.on_commit',
+                        side_effect=lambda job: job()), \
+                mock.patch.object(feeds, '_spawn',
+                                  side_effect=lambda job: job()), \
+                mock.patch.object(feeds, 'connections'):
+            follow.delete()
+        self.assertEqual(self.follow_feed(), [new_post, self.old_post])
+
+    @override_settings(TIMELINE_BACKFILL_DEPTH=1)
+    def test_backfill_depth(self):
+        """При подписке в ленту кладутся только последние посты автора."""
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('post_id', flat=True)),
+            [new_post.pk],
+        )
+
+    @override_settings(FOLLOW_FEED='join')
+    def test_join_mode(self):
+        """В режиме join лента строится без материализации."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_feed(), [self.old_post])
+
+    @override_settings(FOLLOW_FEED='merge', PAGINATION=2)
+    def test_merge_mode(self):
+        """Лента слиянием совпадает с JOIN и листается курсором."""
+        other = User.objects.create_user(username='other_writer')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        Post.objects.create(text='Пост 1', author=other)
+        Post.objects.create(text='Пост 2', author=self.author)
+        Post.objects.create(text='Пост 3', author=other)
+        expected = list(
+            Post.objects.filter(author__following__user=self.reader)
+            .order_by('-pub_date', '-pk')
+        )
+        url = reverse('posts:follow_index')
+        self.client.get(url)
+        with self.assertNumQueries(5):
+            # сессия, пользователь, подписки для ETag и ленты, посты страницы
+            first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(first.object_list) + list(second.object_list), expected
+        )
+        self.assertIsNone(second.next_cursor)
+
+    @override_settings(FOLLOW_FEED='merge', PAGINATION=2,
+                       FOLLOW_MERGE_DEPTH=1)
+    def test_merge_mode_fallback(self):
+        """Если кешированных списков не хватает, лента строится JOIN-ом."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.follow_feed(), [new_post, self.old_post])
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск по постам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='searcher')
+        cls.best = Post.objects.create(
+            author=cls.author, text='Кот и <кот> кот'
+        )
+        cls.other = Post.objects.create(
+            author=cls.author, text='Про котов и собак'
+        )
+        Post.objects.create(author=cls.author, text='Только собака')
+
+    def search(self, query, **params):
+        response = self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response, list(response.context['page_obj'] or [])
+
+    def test_ranked_and_highlighted(self):
+        """Результаты ранжируются по BM25, совпадения подсвечены."""
+        response, posts = self.search('КОТ')
+        self.assertEqual(posts, [self.best, self.other])
+        self.assertContains(response, '<mark>Кот</mark>')
+        self.assertContains(response, '&lt;<mark>кот</mark>&gt;')
+        self.assertTemplateUsed(response, 'posts/post_card.html')
+
+    def test_index_follows_changes(self):
+        """Изменённые и удалённые посты находятся по новому тексту."""
+        post = Post.objects.get(pk=self.other.pk)
+        post.text = 'Про попугаев'
+        post.save()
+        self.assertEqual(self.search('попуга')[1], [post])
+        post.delete()
+        self.assertEqual(self.search('попуга')[1], [])
+        self.assertEqual(self.search('!!!')[1], [])
+
+    @override_settings(PAGINATION=1)
+    def test_cursor_pages(self):
+        """Следующая страница поиска открывается по курсору."""
+        response, first = self.search('кот')
+        cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%82&amp;after=')
+        second = self.search('кот', after=cursor)[1]
+        self.assertEqual(first + second, [self.best, self.other])
+
+    @override_settings(PAGINATION=1)
+    def test_highlight_only_page(self):
+        """Подсветка — только для страницы, подсчёт — без ранга."""
+        with CaptureQueriesContext(connection) as queries:
+            response, posts = self.search('кот')
+        sqls = [query['sql'] for query in queries.captured_queries]
+        self.assertFalse(any('COUNT(' in sql and 'bm25' in sql
+                             for sql in sqls))
+        highlights = [sql for sql in sqls if 'highlight(' in sql]
+        self.assertEqual(len(highlights), 1)
+        self.assertIn(f'IN ({self.best.pk})', highlights[0])
+        self.assertContains(response, '<mark>Кот</mark>')
+
+    def test_admin_search(self):
+        """Поиск в админке идёт по тому же индексу."""
+        admin = User.objects.create_superuser('root', 'root@ya.ru', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': 'собак'})
+        self.assertEqual(
+            list(response.context['cl'].result_list.order_by('pk')),
+            list(Post.objects.exclude(pk=self.best.pk).order_by('pk')),
+        )
+
+
+class PostAdminTests(TestCase):
+    """Список постов в админке не растёт в запросах с числом строк."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser('boss', 'b@ya.ru', 'pw')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'admin-{i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_posts(self, number):
+        for i in range(number):
+            Post.objects.create(author=self.admin, text=f'Пост {i}',
+                                group=self.groups[i % len(self.groups)])
+
+    def changelist_queries(self):
+        url = '/admin/posts/post/'
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertContains(response, 'Группа 1')
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow(self):
+        """Авторы и группы строк не догружаются по одной."""
+        self.add_posts(3)
+        few = self.changelist_queries()
+        self.add_posts(12)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_date_hierarchy_years(self):
+        """Годы иерархии дат берутся по границам индекса."""
+        self.add_posts(1)
+        response = self.client.get('/admin/posts/post/')
+        year = Post.objects.get().pub_date.year
+        self.assertContains(response, f'pub_date__year={year}')
+
+    @override_settings(PAGINATION_COUNT_LIMIT=5)
+    def test_pages_beyond_estimate(self):
+        """Страницы за оценкой открываются, а число строк не выдаётся
+        за точное."""
+        self.add_posts(9)
+        with mock.patch.object(admin.site._registry[Post], 'list_per_page',
+                               2):
+            response = self.client.get('/admin/posts/post/', {'p': 3})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertEqual(str(response.context['cl'].result_count), '5+')
+        self.assertContains(response, '5+')
+
+    def test_move_to_group_action(self):
+        """Перенос в группу — один UPDATE со счётчиками групп."""
+        self.add_posts(6)
+        target = self.groups[0]
+        response = self.client.post('/admin/posts/post/', {
+            'action': 'move_to_group',
+            'select_across': '1',
+            'index': '0',
+            '_selected_action': [Post.objects.first().pk],
+            'group': target.pk,
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(target.posts.count(), 6)
+        self.assertEqual(
+            list(Group.objects.values_list('post_count', flat=True)
+                 .order_by('pk')),
+            [6, 0, 0],
+        )
+
+    def test_export_actions(self):
+        """Выгрузка идёт потоком и содержит все выбранные посты."""
+        self.add_posts(3)
+        for action, lines in (('export_csv', 4), ('export_ndjson', 3)):
+            response = self.client.post('/admin/posts/post/', {
+                'action': action,
+                'select_across': '1',
+                'index': '0',
+                '_selected_action': [Post.objects.first().pk],
+            })
+            self.assertTrue(response.streaming)
+            body = b''.join(response.streaming_content).decode()
+            self.assertEqual(len(body.splitlines()), lines)
+            self.assertIn('admin-1', body)
+
+
+class ConditionalGetTests(TestCase):
+    """Неизменившиеся страницы отдаются ответом 304."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etagger')
+        cls.group = Group.objects.create(title='Группа', slug='etag')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def assert_not_modified_until(self, url, change):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(3):
+            # сессия, пользователь, ключ страницы для ETag
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_post_detail(self):
+        """Новый комментарий меняет ETag страницы поста."""
+        self.assert_not_modified_until(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Новый'
+            ),
+        )
+
+    def test_profile(self):
+        """Новый пост автора меняет ETag профиля."""
+        self.assert_not_modified_until(
+            reverse('posts:profile', kwargs={'username': self.author}),
+            lambda: Post.objects.create(author=self.author, text='Ещё'),
+        )
+
+    def test_profile_owner_follows(self):
+        """Подписка владельца профиля меняет ETag профиля."""
+        other = User.objects.create_user(username='etag_other')
+        self.assert_not_modified_until(
+            reverse('posts:profile', kwargs={'username': self.author}),
+            lambda: Follow.objects.create(user=self.author, author=other),
+        )
+
+    def test_follow(self):
+        """Пост автора из подписок меняет ETag ленты подписок."""
+        reader = User.objects.create_user(username='etag_reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(reader)
+        self.assert_not_modified_until(
+            reverse('posts:follow_index'),
+            lambda: Post.objects.create(author=self.author, text='Ещё'),
+        )
+
+    def test_identity(self):
+        """ETag ленты зависит от пользователя."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.NOT_MODIFIED,
+        )
+        self.client.logout()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            HTTPStatus.OK,
+        )
+
+
+class PostCardTests(TestCase):
+    """Карточка поста рендерится один раз и общая для всех лент."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='carder', first_name='Иван'
+        )
+        cls.group = Group.objects.create(title='Группа', slug='cards')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_card_shared_between_feeds(self):
+        """Карточка из главной ленты переиспользуется в ленте группы."""
+        self.client.get(reverse('posts:index'))
+        with mock.patch(
+            'posts.templatetags.post_cards.render_to_string'
+        ) as render:
+            response = self.client.get(reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ))
+        render.assert_not_called()
+        self.assertContains(response, 'Иван')
+
+    def test_author_rename_invalidates_card(self):
+        """Новое имя автора сразу видно в карточках его постов."""
+        self.client.get(reverse('posts:index'))
+        self.author.first_name = 'Пётр'
+        self.author.save()
+        self.assertContains(self.client.get(reverse('posts:index')), 'Пётр')
+
+    def test_login_keeps_card(self):
+        """Вход автора не сбрасывает карточки."""
+        self.client.get(reverse('posts:index'))
+        self.client.force_login(self.author)
+        with mock.patch(
+            'posts.templatetags.post_cards.render_to_string'
+        ) as render:
+            self.client.get(reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ))
+        render.assert_not_called()
+
+    def test_password_change_keeps_card(self):
+        """Сохранение без смены имени не сбрасывает карточки."""
+        author = User.objects.get(pk=self.author.pk)
+        version = tags_version(f'author:{author.pk}')
+        author.set_password('new-secret')
+        author.save()
+        self.assertEqual(tags_version(f'author:{self.author.pk}'), version)
+
+
+class TemplateLoadingTests(TestCase):
+    """Профилирование и кеширующий загрузчик шаблонов."""
+
+    @override_settings(TEMPLATE_PROFILING=True)
+    def test_server_timing(self):
+        """Время шаблона страницы и его include попадает в Server-Timing."""
+        response = Client().get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        self.assertIn('desc="posts/index.html x1', timing)
+        self.assertIn('desc="includes/header.html x1', timing)
+        self.assertIn('nodes=', timing)
+
+    def test_no_profiling_by_default(self):
+        """Без TEMPLATE_PROFILING заголовка нет."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_warm_up(self):
+        """После прогрева шаблоны не читаются с диска."""
+        options = {
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+            **settings.TEMPLATES[0]['OPTIONS'],
+        }
+        templates = [dict(settings.TEMPLATES[0], APP_DIRS=False,
+                          OPTIONS=options)]
+        with override_settings(TEMPLATES=templates):
+            self.assertGreater(template_cache.warm_up(), 20)
+            with mock.patch(
+                'django.template.loaders.filesystem.Loader.get_contents'
+            ) as get_contents:
+                self.client.get(reverse('posts:index'))
+            get_contents.assert_not_called()
+
+
+@override_settings(PAGE_CACHE=True)
+class AnonymousPageCacheTests(TestCase):
+    """Анонимные страницы отдаются из кеша без запросов к базе."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='paged')
+        cls.post = Post.objects.create(author=cls.author, text='Первый')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:index')
+
+    def test_hit_without_queries(self):
+        """Повторный анонимный запрос не ходит в базу и сжат gzip."""
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertEqual(response.content, first.content)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), first.content)
+
+    def test_stale_while_revalidate(self):
+        """Устаревшая страница отдаётся, пока один запрос её обновляет."""
+        self.client.get(self.url)
+        Post.objects.create(author=self.author, text='Второй')
+        with mock.patch.object(page_cache, '_spawn') as spawn:
+            for _ in range(2):
+                response = self.client.get(self.url)
+                self.assertEqual(response['X-Page-Cache'], 'STALE')
+                self.assertNotContains(response, 'Второй')
+        spawn.assert_called_once()
+        with mock.patch.object(page_cache, 'connections'):
+            spawn.call_args[0][0]()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'Второй')
+
+    def test_deleted_post_leaves_cache(self):
+        """Страница удалённого поста не отдаётся из кеша после обновления."""
+        post = Post.objects.create(author=self.author, text='Удаляемый')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.client.get(url)
+        post.delete()
+        with mock.patch.object(page_cache, '_spawn') as spawn:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'STALE')
+        with mock.patch.object(page_cache, 'connections'):
+            spawn.call_args[0][0]()
+        with mock.patch.object(page_cache, '_spawn') as spawn:
+            response = self.client.get(url)
+        spawn.assert_not_called()
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertNotContains(response, 'Удаляемый',
+                               status_code=HTTPStatus.NOT_FOUND)
+
+    def test_not_modified_from_cache(self):
+        """Кешированная страница отвечает 304 на актуальный ETag."""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+
+    def test_private_requests_bypass(self):
+        """С сессией и с посторонними параметрами кеш не используется."""
+        self.client.get(self.url)
+        response = self.client.get(self.url, {'sort': 'old'})
+        self.assertFalse(response.has_header('X-Page-Cache'))
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class StampedeTests(TestCase):
+    """Истекающую запись пересчитывает один воркер."""
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(side_effect=['старое', 'новое'])
+
+    def test_cached_until_expiry(self):
+        """До срока значение берётся из кеша."""
+        for _ in range(3):
+            self.assertEqual(
+                stampede.get_or_compute('key', self.compute, 60), 'старое'
+            )
+        self.compute.assert_called_once()
+
+    def test_others_serve_old_value(self):
+        """Пока запись пересчитывается, остальные получают прежнее."""
+        stampede.get_or_compute('key', self.compute, 0)
+        cache.add('key:lock', 1)
+        self.assertEqual(
+            stampede.get_or_compute('key', self.compute, 0), 'старое'
+        )
+        cache.delete('key:lock')
+        self.assertEqual(
+            stampede.get_or_compute('key', self.compute, 0), 'новое'
+        )
+
+    def test_early_refresh(self):
+        """Дорогое значение пересчитывается заранее, до срока."""
+        cache.set('key', ('старое', 10.0, time.time() + 5), 60)
+        with mock.patch('random.random', return_value=0.5):
+            self.assertEqual(
+                stampede.get_or_compute('key', self.compute, 60), 'старое'
+            )
+        self.assertEqual(self.compute.call_count, 1)
+        entry = cache.get('key')
+        self.assertGreater(entry[2], time.time() + 50)
+
+    def test_cached_tag(self):
+        """{% cached %} рендерит фрагмент один раз."""
+        source = Template(
+            '{% load cache_tags %}{% cached 60 fragment name %}'
+            '{{ render }}{% endcached %}'
+        )
+        calls = []
+
+        def render():
+            calls.append(1)
+            return 'фрагмент'
+
+        for _ in range(2):
+            self.assertEqual(
+                source.render(Context({'name': 'x', 'render': render})),
+                'фрагмент',
+            )
+        self.assertEqual(len(calls), 1)
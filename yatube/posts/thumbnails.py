@@ -0,0 +1,222 @@
+"""Фоновая подготовка миниатюр постов.
+
+После сохранения поста с картинкой миниатюры размеров из настройки
+THUMBNAIL_PREGENERATE строятся в пуле процессов и записываются в хранилище
+и KV-хранилище sorl-thumbnail. QueuedThumbnailBackend при рендере только
+ищет готовую миниатюру: если её нет, ставит построение в очередь и отдаёт
+исходную картинку, не занимая запрос работой Pillow. Когда миниатюры
+готовы, теги post:<id> постов с этой картинкой сдвигаются, и карточки
+перерисовываются уже с ними.
+
+resolve() проставляет постам страницы post.thumb_url одним пакетным
+чтением KV-хранилища вместо запроса на каждый тег {% thumbnail %}.
+
+DiskKVStore держит метаданные миниатюр в файле SQLite, общем для всех
+процессов: пул и воркеры сайта видят записи друг друга сразу, а прогретое
+хранилище переживает перезапуск.
+"""
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import KVStoreBase, add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache_tags import invalidate
+from core.diskstore import DiskStore
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _init_worker():
+    # Процесс пула мог унаследовать соединения родителя — открываем свои.
+    import django
+    from django.db import connections
+    django.setup()
+    connections.close_all()
+
+
+def _generate(name, geometries):
+    backend = ThumbnailBackend()
+    keys = []
+    for geometry, options in geometries:
+        thumbnail = backend.get_thumbnail(name, geometry, **options)
+        keys.append(thumbnail.key)
+    return keys
+
+
+def _forget_misses(name, future):
+    # Промах по KV-хранилищу кешируется; процесс пула пишет в свой кеш
+    # и базу, поэтому сбрасываем закешированные промахи этого процесса.
+    kv_cache = getattr(default.kvstore, 'cache', None)
+    try:
+        keys = future.result()
+    except Exception:
+        logger.exception('Не удалось построить миниатюры')
+        return
+    if kv_cache is not None:
+        kv_cache.delete_many([add_prefix(key) for key in keys])
+    # Пока миниатюры не было, карточки и статьи постов с этой картинкой
+    # закешированы с оригиналом: сдвигаем их теги.
+    try:
+        post_ids = Post.objects.filter(
+            image=name
+        ).values_list('pk', flat=True)
+        invalidate(*(f'post:{post_id}' for post_id in post_ids))
+    finally:
+        # Колбэк идёт в служебном потоке пула: соединение не оставляем.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def generate(name, geometries=None):
+    """Ставит построение миниатюр файла в очередь пула процессов."""
+    geometries = tuple(geometries or settings.THUMBNAIL_PREGENERATE)
+    if not settings.THUMBNAIL_WORKERS:
+        _generate(name, geometries)
+        return
+    job = (name, tuple((geometry, tuple(sorted(options.items())))
+                       for geometry, options in geometries))
+    with _lock:
+        if job in _pending:
+            return
+        _pending.add(job)
+    future = _get_executor().submit(_generate, name, geometries)
+    future.add_done_callback(partial(_forget_misses, name))
+    future.add_done_callback(lambda _: _pending.discard(job))
+
+
+def pregenerate(post):
+    """Строит миниатюры картинки поста после фиксации транзакции."""
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: generate(name))
+
+
+def thumbnail_file(source, geometry_string, options):
+    """Миниатюра с тем же именем, что строит ThumbnailBackend."""
+    backend = ThumbnailBackend()
+    options = dict(options)
+    # Те же умолчания, что в ThumbnailBackend.get_thumbnail: от них
+    # зависит имя файла миниатюры.
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry_string, options)
+    return ImageFile(name, default.storage)
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Отдаёт только готовые миниатюры, недостающие ставит в очередь."""
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not settings.THUMBNAIL_WORKERS:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        cached = default.kvstore.get(
+            thumbnail_file(source, geometry_string, options)
+        )
+        if cached:
+            return cached
+        generate(source.name, [(geometry_string, options)])
+        return source
+
+
+def _get_many_raw(kvstore, keys):
+    get_many = getattr(kvstore, '_get_many_raw', None)
+    if get_many is not None:
+        return get_many(keys)
+    kv_cache = getattr(kvstore, 'cache', None)
+    if kv_cache is None:
+        values = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    # Хранилище по умолчанию: кеш, затем один запрос к таблице sorl.
+    found = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(KVStoreModel.objects.filter(
+            key__in=missing
+        ).values_list('key', 'value'))
+        kv_cache.set_many(rows, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(rows)
+    # Закешированный промах хранится как класс-заглушка, а не строка.
+    return {key: value for key, value in found.items()
+            if isinstance(value, str)}
+
+
+def resolve(posts, geometry_string, **options):
+    """Проставляет post.thumb_url постам с картинкой за одно чтение."""
+    keys = {}
+    for post in posts:
+        post.thumb_url = None
+        if post.image:
+            thumbnail = thumbnail_file(
+                ImageFile(post.image), geometry_string, options
+            )
+            keys[add_prefix(thumbnail.key)] = post
+    found = _get_many_raw(default.kvstore, list(keys))
+    for key, post in keys.items():
+        if key in found:
+            post.thumb_url = deserialize_image_file(found[key]).url
+            continue
+        # Промах — как в теге {% thumbnail %}: бэкенд строит миниатюру
+        # (или ставит в очередь), а ошибка не роняет страницу.
+        try:
+            post.thumb_url = default.backend.get_thumbnail(
+                post.image, geometry_string, **options
+            ).url
+        except Exception:
+            logger.exception('Не удалось получить миниатюру')
+
+
+class DiskKVStore(KVStoreBase):
+    """KV-хранилище sorl-thumbnail в файле THUMBNAIL_KVSTORE_PATH."""
+
+    def __init__(self):
+        super().__init__()
+        self.store = DiskStore(settings.THUMBNAIL_KVSTORE_PATH)
+
+    def _get_raw(self, key):
+        return self.store.get(key)
+
+    def _set_raw(self, key, value):
+        self.store.set(key, value)
+
+    def _delete_raw(self, *keys):
+        self.store.delete(*keys)
+
+    def _find_keys_raw(self, prefix):
+        return self.store.keys(prefix)
+
+    def _get_many_raw(self, keys):
+        return self.store.get_many(keys)
@@ -1,9 +1,230 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import hashlib
+
 from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Paginator, PageNotAnInteger
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from core.stampede import get_or_compute
+
+
+class EstimatedPaginator(Paginator):
+    """Пагинатор с кешируемым и ограниченным сверху COUNT(*).
+
+    Точное число записей можно передать в count (из счётчиков). Иначе
+    COUNT(*) кешируется на PAGINATION_COUNT_TIMEOUT секунд и считается
+    не дальше PAGINATION_COUNT_LIMIT записей: после порога число
+    страниц оценочное. Считать можно по более простому запросу с теми же
+    строками (count_queryset), например без дорогих аннотаций.
+    """
+
+    def __init__(self, object_list, per_page, *args, count=None,
+                 count_queryset=None, **kwargs):
+        self.count_is_exact = count is not None
+        if count is not None:
+            self.__dict__['count'] = count
+        self.count_queryset = count_queryset
+        super().__init__(object_list, per_page, *args, **kwargs)
+
+    @cached_property
+    def count(self):
+        queryset = self.count_queryset
+        if queryset is None:
+            queryset = self.object_list
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        key = 'paginator_count:' + hashlib.md5(sql.encode()).hexdigest()
+        limit = settings.PAGINATION_COUNT_LIMIT
+        # Для подсчёта порядок не важен, а сортировка среза стоит
+        # лишнего прохода по временной таблице.
+        return get_or_compute(
+            key, queryset.order_by()[:limit + 1].count,
+            settings.PAGINATION_COUNT_TIMEOUT,
+        )
+
+    @property
+    def count_is_estimate(self):
+        return (not self.count_is_exact
+                and self.count > settings.PAGINATION_COUNT_LIMIT)
+
+    def validate_number(self, number):
+        if not self.count_is_estimate:
+            return super().validate_number(number)
+        # После порога число страниц неизвестно: номер сверху не
+        # ограничиваем, пустую страницу отсекает page().
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+    def page(self, number):
+        # Срез не обрезается по count: закешированное значение может
+        # отставать от таблицы на время жизни кеша.
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if not self.count_is_estimate or number < self.num_pages:
+            return self._get_page(self.object_list[bottom:top], number, self)
+        # С последней по оценке страницы записи могут идти дальше: по
+        # числу строк среза с одной лишней узнаём, есть ли следующая.
+        # Сама страница остаётся QuerySet: его ждут формы списка админки.
+        found = self.object_list[bottom:top + 1].count()
+        if not found and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        self.__dict__['num_pages'] = number + (found > self.per_page)
+        return self._get_page(self.object_list[bottom:top], number, self)
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Номер за оценкой оказался за концом ленты.
+            return self.page(self.num_pages)
+
+
+class CursorPaginator(EstimatedPaginator):
+    """Пагинатор с дополнительным режимом курсоров по (key_field, tie_field).
+
+    Страницы по номеру работают как у обычного Paginator, а страницы
+    по курсору (?after=/?before=) выбираются условием по ключу без
+    OFFSET и не сдвигаются, когда в ленту добавляются новые записи.
+    При оценочном числе страниц в шаблон уходит только окно номеров.
+
+    Ключ по умолчанию — дата; для других ключей (например, ранга поиска)
+    передаётся key_parser, восстанавливающий значение из курсора.
+    """
+
+    def __init__(self, object_list, per_page, key_field='pub_date',
+                 tie_field='pk', descending=True, key_parser=parse_datetime,
+                 **kwargs):
+        self.key_field = key_field
+        self.tie_field = tie_field
+        self.key_parser = key_parser
+        self.descending = descending
+        prefix = '-' if descending else ''
+        object_list = object_list.order_by(
+            prefix + key_field, prefix + tie_field
+        )
+        super().__init__(object_list, per_page, **kwargs)
+
+    def page_window(self, number):
+        """Номера страниц вокруг текущей для ссылок в шаблоне."""
+        width = settings.PAGINATION_WINDOW
+        return range(
+            max(1, number - width), min(self.num_pages, number + width) + 1
+        )
+
+    def number_page(self, number):
+        """Страница по номеру вместе с окном ссылок и курсорами."""
+        page = self.get_page(number)
+        page.page_window = self.page_window(page.number)
+        return self.add_cursors(page)
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.key_field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        tie = getattr(obj, self.tie_field)
+        raw = f'{value}|{tie}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """Возвращает (ключ, значение tie_field) или None для битого токена."""
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            value, pk = raw.split('|')
+            return self.key_parser(value), int(pk)
+        except (ValueError, UnicodeError, binascii.Error):
+            return None
+
+    def cursor_page(self, after=None, before=None):
+        """Страница сразу после (или сразу перед) записью из курсора."""
+        cursor = self.decode_cursor(after or before)
+        if cursor is None or cursor[0] is None:
+            return self.number_page(1)
+        value, pk = cursor
+        lookup = 'lt' if bool(after) == self.descending else 'gt'
+        queryset = self.object_list.filter(
+            Q(**{f'{self.key_field}__{lookup}': value})
+            | Q(**{self.key_field: value, f'{self.tie_field}__{lookup}': pk})
+        )
+        if not after:
+            queryset = queryset.reverse()
+        items = list(queryset[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if after:
+            return self.make_page(items, has_next=has_more,
+                                  has_previous=True)
+        items.reverse()
+        return self.make_page(items, has_next=True, has_previous=has_more)
+
+    def head_page(self):
+        """Первая страница курсорного режима, без COUNT(*)."""
+        items = list(self.object_list[:self.per_page + 1])
+        return self.make_page(items[:self.per_page],
+                              has_next=len(items) > self.per_page,
+                              has_previous=False)
+
+    def make_page(self, items, has_next, has_previous):
+        """Собирает страницу курсорного режима: без номера и без COUNT."""
+        page = self._get_page(items, None, self)
+        page.next_cursor = (
+            self.encode_cursor(items[-1]) if items and has_next else None
+        )
+        page.previous_cursor = (
+            self.encode_cursor(items[0]) if items and has_previous else None
+        )
+        return page
+
+    def add_cursors(self, page):
+        """Добавляет курсоры соседних страниц к странице по номеру."""
+        has_items = len(page) > 0
+        page.next_cursor = (
+            self.encode_cursor(page[-1])
+            if has_items and page.has_next() else None
+        )
+        page.previous_cursor = (
+            self.encode_cursor(page[0])
+            if has_items and page.has_previous() else None
+        )
+        return page
+
+
+def paginate(request, posts, count=None, **ordering):
+    paginator = CursorPaginator(
+        posts, settings.PAGINATION, count=count, **ordering
+    )
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before:
+        return paginator.cursor_page(after=after, before=before)
+    return paginator.number_page(request.GET.get('page'))
 
 
-def paginate(request, posts):
-    paginator = Paginator(posts, settings.PAGINATION)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+def paginate_comments(request, post):
+    """Комментарии поста от старых к новым, «показать ещё» по курсору."""
+    comments = post.comments.select_related('author').only(
+        'text', 'created', 'post', 'author__username'
+    )
+    paginator = CursorPaginator(
+        comments, settings.COMMENTS_PAGINATION,
+        key_field='created', descending=False
+    )
+    after = request.GET.get('comments_after')
+    if after:
+        return paginator.cursor_page(after=after)
+    return paginator.head_page()
@@ -1,16 +1,26 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
-
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import quote_etag, urlencode
+from django.views.decorators.http import condition
+
+from . import etags, images, search
+from .counters import author_stats
+from .feeds import follow_page
 from .forms import PostForm, CommentForm
-from .models import Group, Post, Comment, Follow
-from .utils import paginate
+from .models import Group, Post, Follow
+from .utils import paginate, paginate_comments
 
 User = get_user_model()
 
 
+@condition(etag_func=etags.index_etag)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.for_feed()
     page_obj = paginate(request, posts)
     context = {
         'page_obj': page_obj,
@@ -18,10 +28,11 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=etags.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginate(request, posts)
+    posts = group.posts.for_feed()
+    page_obj = paginate(request, posts, count=group.post_count)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -29,11 +40,12 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=etags.profile_etag)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    post_count = posts.count()
-    page_obj = paginate(request, posts)
+    stats = author_stats(author)
+    posts = author.posts.for_feed()
+    page_obj = paginate(request, posts, count=stats.post_count)
     following = False
     if request.user.is_authenticated:
         if Follow.objects.filter(user=request.user, author=author).exists():
@@ -41,26 +53,69 @@ def profile(request, username):
     context = {
         'page_obj': page_obj,
         'author': author,
-        'post_count': post_count,
+        'post_count': stats.post_count,
+        'stats': stats,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=etags.post_etag)
 def post_detail(request, post_id):
     form = CommentForm()
-    post = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.all()
-    post_count = post.author.posts.count()
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    # Страница комментариев выбирается только при рендере фрагмента:
+    # из кеша фрагмент отдаётся без запроса к комментариям.
+    comments = SimpleLazyObject(lambda: paginate_comments(request, post))
     context = {
         'post': post,
-        'post_count': post_count,
+        'post_count': author_stats(post.author).post_count,
         'form': form,
         'comments': comments,
+        'comment_count': post.comment_count,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = paginate(
+            request, search.search_posts(query),
+            count_queryset=search.filter_posts(Post.objects, query),
+            key_field='rank', descending=False, key_parser=float,
+        )
+        search.add_headlines(page_obj, query)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def image_variant(request, post_id, width, fmt):
+    post = get_object_or_404(Post.objects.only('image'), pk=post_id)
+    if (not post.image
+            or width not in settings.IMAGE_VARIANT_WIDTHS
+            or fmt not in images.variant_formats()):
+        raise Http404
+    # Имя файла входит в ETag и в ?v= ссылки: новая картинка — новый URL.
+    name = post.image.name
+    etag = quote_etag(f'{images.variant_version(name)}-{width}.{fmt}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(
+            open(images.render_variant(name, width, fmt), 'rb'),
+            content_type=f'image/{fmt}',
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, immutable=True,
+                        max_age=settings.IMAGE_VARIANT_MAX_AGE)
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None,)
@@ -111,9 +166,9 @@ def add_comment(request, post_id):
 
 
 @login_required
+@condition(etag_func=etags.follow_etag)
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginate(request, posts)
+    page_obj = follow_page(request)
     context = {
         'page_obj': page_obj,
     }
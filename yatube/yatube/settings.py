@@ -30,7 +30,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.TemplateProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.page_cache.AnonymousPageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,6 +60,8 @@ TEMPLATES = [
         },
     },
 ]
+# Время рендера каждого шаблона в заголовке Server-Timing.
+TEMPLATE_PROFILING = False
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -107,14 +111,118 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGINATION: int = 10
+COMMENTS_PAGINATION = 20
+PAGINATION_WINDOW = 3
+PAGINATION_COUNT_LIMIT = 10000
+PAGINATION_COUNT_TIMEOUT = 60
+
+# 'timeline' — материализованные ленты подписок, 'merge' — слияние
+# кешированных списков постов авторов, 'join' — JOIN при чтении.
+FOLLOW_FEED = 'timeline'
+FOLLOW_FANOUT_LIMIT = 5000
+FOLLOW_MERGE_DEPTH = 100
+# Сколько последних постов автора кладётся в ленту при подписке и при
+# пересборке лент: остальное видно в профиле автора.
+TIMELINE_BACKFILL_DEPTH = 200
+
+# Истекающие фрагменты и счётчики пересчитывает один воркер (см.
+# core.stampede): BETA > 1 — пересчёт раньше, WAIT — сколько ждать чужой
+# пересчёт, если прежнего значения нет.
+STAMPEDE_BETA = 1.0
+STAMPEDE_GRACE = 60
+STAMPEDE_LOCK_TIMEOUT = 30
+STAMPEDE_WAIT = 1.0
+STAMPEDE_WAIT_STEP = 0.05
+
+# Страницы для анонимов целиком в кеше: свежие PAGE_CACHE_TIMEOUT секунд,
+# потом ещё PAGE_CACHE_STALE_TIMEOUT отдаются устаревшими, пока один
+# запрос обновляет их в фоне.
+PAGE_CACHE = not DEBUG
+PAGE_CACHE_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+)
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE_TIMEOUT = 10 * 60
+PAGE_CACHE_LOCK_TIMEOUT = 30
+
+# Сколько живёт отрендеренная карточка поста; устаревшие карточки
+# отсекаются версиями тегов поста, автора и группы.
+POST_CARD_TIMEOUT = 24 * 60 * 60
+
+# Размер пачки строк при потоковой выгрузке постов из админки.
+EXPORT_CHUNK_SIZE = 2000
+
+# Загрузка картинок: файл больше FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет
+# на диск по частям; оригинал пережимается до IMAGE_MAX_SIDE по большей
+# стороне, а распаковывать больше IMAGE_MAX_PIXELS пикселей не даём.
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+IMAGE_MAX_SIDE = 2560
+IMAGE_MAX_PIXELS = 16 * 1000 * 1000
+IMAGE_QUALITY = 85
+
+# Варианты картинок для srcset: кадрирование как у миниатюры ленты.
+IMAGE_VARIANT_DIR = 'variants'
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_RATIO = (960, 339)
+IMAGE_VARIANT_SIZES = '(max-width: 960px) 100vw, 960px'
+IMAGE_VARIANT_MAX_AGE = 365 * 24 * 60 * 60
+
+# Миниатюры из шаблонов лент: строятся в фоне сразу после загрузки.
+THUMBNAIL_PREGENERATE = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+# 0 — строить миниатюры синхронно, без пула процессов.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_KVSTORE_PATH = os.path.join(BASE_DIR, 'thumbnails.sqlite3')
+if not DEBUG:
+    THUMBNAIL_BACKEND = 'posts.thumbnails.QueuedThumbnailBackend'
+    THUMBNAIL_KVSTORE = 'posts.thumbnails.DiskKVStore'
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кеш процесса ограничен объёмом, а не числом записей; счётчики по
+# префиксам ключей показывает manage.py cache_stats.
+CACHE_MAX_BYTES = 64 * 1024 * 1024
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.budget_cache.BudgetCache',
+        'OPTIONS': {'MAX_BYTES': CACHE_MAX_BYTES},
     }
 }
+# Без DEBUG воркеры делят один кеш в файле SQLite: прогрев и сброс тегов
+# в одном процессе сразу видны остальным. Перед ним у каждого процесса
+# L1 в памяти, согласованный через поколения в общем кеше.
+if not DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.tiered_cache.TieredCache',
+            'OPTIONS': {
+                'L1': 'local',
+                'L2': 'shared',
+                'L1_TIMEOUT': 5,
+                'SYNC_INTERVAL': 1,
+            },
+        },
+        'local': {
+            'BACKEND': 'core.budget_cache.BudgetCache',
+            'OPTIONS': {
+                'MAX_BYTES': CACHE_MAX_BYTES,
+                'STATS_PATH': os.path.join(BASE_DIR, 'cache_stats.sqlite3'),
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.sqlite_cache.SQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            # Карточки и фрагменты — единицы килобайт: 100 тысяч записей
+            # занимают сотни мегабайт. По умолчанию Django держит 300.
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }